@@ -68,6 +68,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_cleanup.apps.CleanupConfig",
     "django_filters",
     "django_extensions",
@@ -180,6 +181,17 @@ STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
+# Set to the fake_stripe command address to run checkout offline
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
+
+PAYMENT_GATEWAY = os.getenv("PAYMENT_GATEWAY", "marketplace_app.payments.StripeGateway")
+
+# Stripe calls give up after these seconds, retried with backoff up to STRIPE_MAX_RETRIES
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", 3))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", 10))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", 2))
+STRIPE_POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", 10))
+
 CELERY_BROKER_URL = f"{REDIS_URL}/0"
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_ACCEPT_CONTENT = ["json"]
@@ -208,6 +220,10 @@ CELERY_BEAT_SCHEDULE = {
         "task": "marketplace_app.tasks.sync_redis_stock",
         "schedule": timedelta(minutes=10),
     },
+    "process-pending-stripe-events": {
+        "task": "marketplace_app.tasks.process_pending_stripe_events",
+        "schedule": timedelta(minutes=5),
+    },
 }
 
 SPECTACULAR_SETTINGS = {
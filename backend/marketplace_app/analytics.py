@@ -0,0 +1,165 @@
+from collections import defaultdict
+from datetime import datetime, time
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import OrderItem, SellerDailySales
+
+Status = OrderItem.ShippingStatus
+
+# Rollup column of the sold items in each shipping status, other items aren't sales
+STATUS_COLUMNS = {
+    Status.AWAITING_SHIPMENT: "items_awaiting_shipment",
+    Status.IN_TRANSIT: "items_in_transit",
+    Status.OUT_FOR_DELIVERY: "items_in_transit",
+    Status.DELIVERED: "items_delivered",
+}
+
+# Taken shared by rollups and exclusive by rebuilds, so a rebuild never deletes
+# rows a rollup is adding to nor misses the items of a rollup in flight
+SALES_LOCK = 0x53414C4553
+
+# Days of sales served by default, and at most, by the seller sales endpoint
+SALES_RANGE_DAYS = 30
+SALES_MAX_RANGE_DAYS = 366
+
+COLUMNS = [
+    "revenue",
+    "units",
+    "orders",
+    "items_awaiting_shipment",
+    "items_in_transit",
+    "items_delivered",
+]
+
+
+# Orders count toward the day they were placed on in settings.TIME_ZONE, whatever
+# the active or database session time zone
+def sales_timezone():
+    return timezone.get_default_timezone()
+
+
+# Day of a datetime for the sales rollups, today by default
+def sales_day(value=None):
+    return timezone.localdate(value, timezone=sales_timezone())
+
+
+# What roll_up_items needs of the items, read before their status changes
+def sales_rows(items):
+    return list(
+        items.values(
+            "listing_id",
+            "seller_id",
+            "order_id",
+            "order__created_at",
+            "quantity",
+            "snapshot_listing_price",
+            "status",
+        )
+    )
+
+
+# Apply the items moving to status to the daily sales of their sellers, in the
+# transaction changing them. Rows are added to in a single upsert.
+def roll_up_items(rows, status):
+    deltas = defaultdict(lambda: dict.fromkeys(COLUMNS, 0))
+    # (seller, day, order) -> whether the order was and is a sale of the seller
+    orders = defaultdict(lambda: [False, False])
+
+    for row in rows:
+        # Items of deleted accounts have no seller to roll up to
+        if row["seller_id"] is None:
+            continue
+
+        key = (row["seller_id"], sales_day(row["order__created_at"]))
+        delta = deltas[key]
+        was_sold = row["status"] in STATUS_COLUMNS
+        is_sold = status in STATUS_COLUMNS
+
+        sign = int(is_sold) - int(was_sold)
+        delta["revenue"] += sign * row["snapshot_listing_price"] * row["quantity"]
+        delta["units"] += sign * row["quantity"]
+        if was_sold:
+            delta[STATUS_COLUMNS[row["status"]]] -= 1
+        if is_sold:
+            delta[STATUS_COLUMNS[status]] += 1
+
+        sold = orders[(*key, row["order_id"])]
+        sold[0] |= was_sold
+        sold[1] |= is_sold
+
+    for (seller_id, day, _), (was_sold, is_sold) in orders.items():
+        deltas[(seller_id, day)]["orders"] += int(is_sold) - int(was_sold)
+
+    # Upsert the rows in a stable order so concurrent orders can't deadlock
+    lines = [
+        (seller_id, day, *[delta[column] for column in COLUMNS])
+        for (seller_id, day), delta in sorted(deltas.items())
+        if any(delta.values())
+    ]
+    if not lines:
+        return
+
+    table = SellerDailySales._meta.db_table
+    values = ", ".join(
+        ["(%s::uuid, %s::date, %s::numeric" + ", %s::integer" * 5 + ")"] * len(lines)
+    )
+    columns = ", ".join(COLUMNS)
+    increments = ", ".join(
+        f"{column} = {table}.{column} + EXCLUDED.{column}" for column in COLUMNS
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock_shared(%s)", [SALES_LOCK])
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (seller_id, day, {columns})
+            VALUES {values}
+            ON CONFLICT (seller_id, day) DO UPDATE SET {increments}
+            """,
+            [value for line in lines for value in line],
+        )
+
+
+# Daily sales of a seller from start to end included, and their totals
+def seller_sales(seller, start, end):
+    days = list(SellerDailySales.objects.filter(seller=seller, day__range=(start, end)))
+    totals = {column: sum(getattr(day, column) for day in days) for column in COLUMNS}
+    return {"start": start, "end": end, "totals": totals, "days": days}
+
+
+# Recompute the daily sales of [start, end) from the order items
+@transaction.atomic
+def rebuild_seller_sales(start, end):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SALES_LOCK])
+
+    SellerDailySales.objects.filter(day__gte=start, day__lt=end).delete()
+
+    tz = sales_timezone()
+    rows = (
+        OrderItem.objects.filter(
+            seller__isnull=False,
+            status__in=STATUS_COLUMNS,
+            order__created_at__gte=datetime.combine(start, time(), tz),
+            order__created_at__lt=datetime.combine(end, time(), tz),
+        )
+        .annotate(day=TruncDate("order__created_at", tzinfo=tz))
+        .values("seller_id", "day")
+        .annotate(
+            revenue=Sum(F("snapshot_listing_price") * F("quantity")),
+            units=Sum("quantity"),
+            orders=Count("order_id", distinct=True),
+            items_awaiting_shipment=Count(
+                "id", filter=Q(status=Status.AWAITING_SHIPMENT)
+            ),
+            items_in_transit=Count(
+                "id", filter=Q(status__in=[Status.IN_TRANSIT, Status.OUT_FOR_DELIVERY])
+            ),
+            items_delivered=Count("id", filter=Q(status=Status.DELIVERED)),
+        )
+    )
+    return len(
+        SellerDailySales.objects.bulk_create(SellerDailySales(**row) for row in rows)
+    )
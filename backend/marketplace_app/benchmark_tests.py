@@ -0,0 +1,277 @@
+import json
+import os
+import time
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from unittest.mock import patch
+from .models import (
+    User,
+    Listing,
+    ListingImage,
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    OrderParticipant,
+)
+
+# Deselected by default, run with pytest -m benchmark
+pytestmark = pytest.mark.benchmark
+
+# Listings seeded per run, orders and images scale with it
+VOLUME = int(os.getenv("BENCHMARK_VOLUME", 2000))
+
+# Report written after the run when a path is given, pass a previous one as
+# baseline to compare commits
+REPORT_PATH = os.getenv("BENCHMARK_REPORT")
+BASELINE_PATH = os.getenv("BENCHMARK_BASELINE")
+
+# Most queries each route may run, whatever the volume and the cart size
+QUERY_BUDGETS = {
+    "listings-list": 2,
+    "listings-search": 2,
+    "listings-detail": 2,
+    "listings-autocomplete": 1,
+    "cart-list": 6,
+    "order-list-buyer": 2,
+    "order-list-seller": 2,
+    "order-detail": 2,
+    "checkout": 13,
+    "stripe-webhook": 4,
+}
+
+report = {}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def benchmark_report():
+    yield
+
+    if not REPORT_PATH:
+        return
+
+    baseline = {}
+    if BASELINE_PATH and os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)["routes"]
+
+    for name, result in report.items():
+        if name in baseline:
+            result["queries_delta"] = result["queries"] - baseline[name]["queries"]
+            result["ms_delta"] = round(result["ms"] - baseline[name]["ms"], 2)
+
+    with open(REPORT_PATH, "w") as file:
+        json.dump(
+            {"commit": os.getenv("GIT_COMMIT", ""), "volume": VOLUME, "routes": report},
+            file,
+            indent=2,
+        )
+
+
+# Seeded once for every route, each test rolls back what its request changed
+@pytest.fixture(scope="module")
+def catalog(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        data = seed_catalog()
+        yield data
+
+        Order.objects.filter(buyer=data["buyer"]).delete()
+        User.objects.filter(id__in=data["users"]).delete()
+
+
+def seed_catalog():
+    buyer = User.objects.create_user(
+        username="bench_buyer",
+        email="bench_buyer@mail.com",
+        location="Av. Paulista, 1000",
+    )
+    sellers = User.objects.bulk_create(
+        User(username=f"bench_seller{i}", email=f"bench_seller{i}@mail.com")
+        for i in range(20)
+    )
+
+    listings = Listing.objects.bulk_create(
+        Listing(
+            seller=sellers[i % len(sellers)],
+            title=f"Vintage camera {i}" if i % 10 == 0 else f"Item {i}",
+            description="Benchmark listing",
+            price=10 + i % 90,
+            quantity=100,
+        )
+        for i in range(VOLUME)
+    )
+
+    images = ListingImage.objects.bulk_create(
+        ListingImage(listing=listing, image=f"{listing.id}.jpg", is_main=main)
+        for listing in listings
+        for main in (True, False)
+    )
+    for listing, image in zip(listings, images[::2]):
+        listing.main_image = image
+    Listing.objects.bulk_update(listings, ["main_image"], batch_size=500)
+
+    cart = Cart.objects.create(user=buyer)
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, listing=listing, quantity=1) for listing in listings[:20]
+    )
+
+    orders = Order.objects.bulk_create(
+        Order(
+            buyer=buyer,
+            total_price=20,
+            status=Order.PaymentStatus.PAID,
+            buyer_address=buyer.location,
+            buyer_email=buyer.email,
+        )
+        for _ in range(VOLUME // 4)
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(
+            order=order,
+            listing=listing,
+            seller=listing.seller,
+            status=OrderItem.ShippingStatus.AWAITING_SHIPMENT,
+            snapshot_seller_id=listing.seller.id,
+            snapshot_seller_username=listing.seller.username,
+            snapshot_listing_price=listing.price,
+            snapshot_listing_id=listing.id,
+            snapshot_listing_title=listing.title,
+            quantity=1,
+        )
+        for i, order in enumerate(orders)
+        for listing in (listings[i * 2], listings[i * 2 + 1])
+    )
+    OrderParticipant.objects.bulk_create(
+        OrderParticipant(order=order, user=user, role=role)
+        for i, order in enumerate(orders)
+        for user, role in (
+            (buyer, OrderParticipant.Role.BUYER),
+            (listings[i * 2].seller, OrderParticipant.Role.SELLER),
+            (listings[i * 2 + 1].seller, OrderParticipant.Role.SELLER),
+        )
+    )
+
+    cache.delete_pattern("autocomplete:*")
+    return {
+        "buyer": buyer,
+        "seller": sellers[0],
+        "users": [buyer.id] + [seller.id for seller in sellers],
+        "listing": listings[0],
+        "order": orders[0],
+    }
+
+
+# Each route prepares its request and returns it, only the request is measured
+def checkout(client, catalog):
+    client.force_authenticate(user=catalog["buyer"])
+
+    def request():
+        with patch(
+            "marketplace_app.payments.stripe.PaymentIntentService.create"
+        ) as create:
+            create.return_value = type(
+                "obj", (object,), {"id": "pi_12345", "client_secret": "secret_123"}
+            )
+            return client.post(reverse("order-list"))
+
+    return request
+
+
+def stripe_webhook(client, catalog):
+    buyer = catalog["buyer"]
+    order = Order.objects.create(
+        buyer=buyer,
+        total_price=20,
+        intent_id="pi_12345",
+        buyer_address=buyer.location,
+        buyer_email=buyer.email,
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(
+            order=order,
+            listing=item.listing,
+            seller=item.listing.seller,
+            snapshot_seller_id=item.listing.seller.id,
+            snapshot_seller_username=item.listing.seller.username,
+            snapshot_listing_price=item.listing.price,
+            snapshot_listing_id=item.listing.id,
+            snapshot_listing_title=item.listing.title,
+            quantity=1,
+        )
+        for item in CartItem.objects.filter(cart__user=buyer).select_related(
+            "listing__seller"
+        )
+    )
+    payload = {
+        "id": "evt_12345",
+        "type": "payment_intent.succeeded",
+        "created": int(order.created_at.timestamp()),
+        "data": {"object": {"id": "pi_12345", "metadata": {"order_id": order.id}}},
+    }
+
+    def request():
+        with patch("stripe.Webhook.construct_event") as construct_event:
+            construct_event.return_value = payload
+            return client.post(
+                reverse("stripe_webhook"),
+                data=payload,
+                format="json",
+                HTTP_STRIPE_SIGNATURE="fake_signature",
+            )
+
+    return request
+
+
+def get(url_name, user=None, params=None, url_kwargs=None):
+    def prepare(client, catalog):
+        if user:
+            client.force_authenticate(user=catalog[user])
+        url = reverse(url_name, kwargs=url_kwargs(catalog) if url_kwargs else None)
+        return lambda: client.get(url, params)
+
+    return prepare
+
+
+ROUTES = {
+    "listings-list": get("listings-list"),
+    "listings-search": get("listings-list", params={"search": "vintage camera"}),
+    "listings-detail": get(
+        "listings-detail", url_kwargs=lambda catalog: {"pk": catalog["listing"].id}
+    ),
+    "listings-autocomplete": get("listings-autocomplete", params={"q": "vintage"}),
+    "cart-list": get("cart-list", user="buyer"),
+    "order-list-buyer": get("order-list", user="buyer"),
+    "order-list-seller": get("order-list", user="seller", params={"view": "seller"}),
+    "order-detail": get(
+        "order-detail",
+        user="buyer",
+        url_kwargs=lambda catalog: {"id": catalog["order"].id},
+    ),
+    "checkout": checkout,
+    "stripe-webhook": stripe_webhook,
+}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("name", ROUTES)
+def test_route_benchmark(client, catalog, name):
+    request = ROUTES[name](client, catalog)
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = request()
+        elapsed = time.perf_counter() - start
+
+    report[name] = {
+        "status": response.status_code,
+        "queries": len(queries),
+        "ms": round(elapsed * 1000, 2),
+    }
+
+    assert response.status_code < 300
+    assert len(queries) <= QUERY_BUDGETS[name], "\n".join(
+        query["sql"] for query in queries
+    )
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django_redis import get_redis_connection
+from prometheus_client import Counter
+
+from .payments import max_call_seconds
+from .stock import stock_key, reserved_stock
+
+# Rendered listing details live until their listing version is bumped, or this long
+LISTING_DETAIL_TIMEOUT = 60 * 60
+
+# Browse pages are fresh for this long, then served stale while one request refreshes
+LISTING_PAGE_FRESH = 30
+LISTING_PAGE_TIMEOUT = 10 * 60
+
+# Stripe intent status seen by pending orders polling it
+PAYMENT_INTENT_TIMEOUT = 60
+
+# Responses replayed for a repeated Idempotency-Key
+IDEMPOTENCY_TIMEOUT = 24 * 60 * 60
+
+# Checkout calls the gateway up to twice, to check the intent of an order and to
+# replace it, the lock of a request in flight outlives both plus this margin
+IDEMPOTENCY_GATEWAY_CALLS = 2
+IDEMPOTENCY_LOCK_MARGIN = 10
+
+# How long a request may hold a recompute lock, and how long others wait on it
+SINGLE_FLIGHT_LOCK = 10
+SINGLE_FLIGHT_WAIT = 2
+SINGLE_FLIGHT_POLL = 0.05
+
+# Higher values refresh hot keys earlier before they expire
+EARLY_REFRESH_BETA = 1.0
+
+CACHE_REQUESTS = Counter(
+    "marketplace_cache_requests_total",
+    "Single flight cache lookups by result",
+    ["cache", "result"],
+)
+
+
+# Delete a lock only while it still holds the token of the request that took it
+# KEYS: lock
+# ARGV: token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+# Token of a lock held on key for timeout seconds, None when another request has it
+def acquire_lock(key, timeout):
+    token = uuid.uuid4().hex
+    if get_redis_connection("default").set(
+        cache.make_key(key), token, nx=True, ex=math.ceil(timeout)
+    ):
+        return token
+    return None
+
+
+# Release a lock unless it expired and another request took it since
+def release_lock(key, token):
+    get_redis_connection("default").register_script(RELEASE_LOCK_SCRIPT)(
+        keys=[cache.make_key(key)], args=[token]
+    )
+
+
+# Seconds the lock of a checkout with an Idempotency-Key is held at most
+def idempotency_lock_timeout():
+    return IDEMPOTENCY_GATEWAY_CALLS * max_call_seconds() + IDEMPOTENCY_LOCK_MARGIN
+
+
+# Cached value of key, computed by a single request at a time
+# hit:       fresh entry
+# miss:      this request computed it
+# stale:     another request is recomputing it, the previous value is served
+# coalesced: nothing to serve, waited for the request computing it
+# timeout:   waited too long, computed without storing it
+# Entries are refreshed early with a probability growing close to their expiry,
+# and an entry of another version is stale. Stale entries are kept stale_timeout.
+def single_flight(name, key, compute, timeout, stale_timeout=0, version=None):
+    entry = cache.get(key)
+
+    if entry is not None and entry["version"] == version:
+        early = entry["delta"] * EARLY_REFRESH_BETA * math.log(1 - random.random())
+        if time.time() - early < entry["expires"]:
+            CACHE_REQUESTS.labels(name, "hit").inc()
+            return entry["value"]
+
+    lock = f"{key}:lock"
+    token = acquire_lock(lock, SINGLE_FLIGHT_LOCK)
+
+    if token is None:
+        if entry is not None:
+            CACHE_REQUESTS.labels(name, "stale").inc()
+            return entry["value"]
+
+        deadline = time.time() + SINGLE_FLIGHT_WAIT
+        while time.time() < deadline:
+            time.sleep(SINGLE_FLIGHT_POLL)
+            entry = cache.get(key)
+            if entry is not None and entry["version"] == version:
+                CACHE_REQUESTS.labels(name, "coalesced").inc()
+                return entry["value"]
+
+        # The lock isn't ours, leave storing the value to its owner
+        CACHE_REQUESTS.labels(name, "timeout").inc()
+        return compute()
+
+    try:
+        # Another request may have stored the value since it was read
+        latest = cache.get(key)
+        if (
+            latest is not None
+            and latest["version"] == version
+            and latest["expires"] > time.time()
+            and (entry is None or latest["expires"] != entry["expires"])
+        ):
+            CACHE_REQUESTS.labels(name, "coalesced").inc()
+            return latest["value"]
+
+        CACHE_REQUESTS.labels(name, "miss").inc()
+        start = time.time()
+        value = compute()
+        now = time.time()
+        cache.set(
+            key,
+            {
+                "value": value,
+                "version": version,
+                "delta": now - start,
+                "expires": now + timeout,
+            },
+            timeout=timeout + stale_timeout,
+        )
+    finally:
+        release_lock(lock, token)
+
+    return value
+
+
+# listing_version:<listing_id> -> counter bumped on every listing change
+# listing_detail:<listing_id>  -> rendered listing and its digest, per version
+# listing_pages_generation     -> counter bumped on any listing change
+# listing_page:<params digest> -> rendered page, per generation
+def listing_version_key(listing_id):
+    return cache.make_key(f"listing_version:{listing_id}")
+
+
+# Invalidate the cached details of the listings, and every browse page, once the
+# transaction commits so a reader can't cache the old rows under the new version
+def bump_listing_versions(listing_ids):
+    listing_ids = set(listing_ids)
+    if not listing_ids:
+        return
+
+    def bump():
+        pipeline = get_redis_connection("default").pipeline(transaction=False)
+        for listing_id in listing_ids:
+            pipeline.incr(listing_version_key(listing_id))
+        pipeline.incr(cache.make_key("listing_pages_generation"))
+        pipeline.execute()
+
+    transaction.on_commit(bump)
+
+
+# Rendered listing and its ETag, rendering it only when its version changed
+# Available stock is applied on every read as reservations don't bump the version
+def cached_listing_detail(listing_id, render):
+    version, reserved = get_redis_connection("default").mget(
+        [listing_version_key(listing_id), stock_key(listing_id)]
+    )
+
+    def compute():
+        data = render()
+        digest = hashlib.md5(
+            json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        ).hexdigest()
+        return {"data": data, "digest": digest}
+
+    cached = single_flight(
+        "listing_detail",
+        f"listing_detail:{listing_id}",
+        compute,
+        timeout=LISTING_DETAIL_TIMEOUT,
+        version=int(version or 0),
+    )
+
+    available_stock = max(0, cached["data"]["quantity"] - int(reserved or 0))
+    data = {**cached["data"], "available_stock": available_stock}
+    return data, f'"{cached["digest"]}-{available_stock}"'
+
+
+def listing_page_key(params):
+    # Same filters in any order, or with blank values, share a page
+    normalized = sorted(
+        (key, value.strip())
+        for key in params
+        for value in params.getlist(key)
+        if value.strip()
+    )
+    return f"listing_page:{hashlib.md5(urlencode(normalized).encode()).hexdigest()}"
+
+
+# Browse page for the query params, a stale page keeps being served while a
+# single request refreshes it
+def cached_listing_page(params, render):
+    data = single_flight(
+        "listing_page",
+        listing_page_key(params),
+        render,
+        timeout=LISTING_PAGE_FRESH,
+        stale_timeout=LISTING_PAGE_TIMEOUT,
+        version=cache.get("listing_pages_generation", 0),
+    )
+
+    # Reservations don't touch the generation, stock is applied on every read
+    reserved = reserved_stock([item["id"] for item in data["results"]])
+    results = [
+        {**item, "available_stock": max(0, item["quantity"] - reserved[item["id"]])}
+        for item in data["results"]
+    ]
+    return {**data, "results": results}
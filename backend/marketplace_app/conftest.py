@@ -1,6 +1,7 @@
 from decimal import Decimal
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from .models import Listing
 
@@ -41,4 +42,16 @@ def listing(db, seller):
 
 @pytest.fixture
 def client(db):
-    return APIClient()
\ No newline at end of file
+    return APIClient()
+
+
+@pytest.fixture(autouse=True)
+def cached_responses():
+    # Responses cached in Redis would outlive the test database
+    for pattern in (
+        "listing_page:*",
+        "payment_intent:*",
+        "idempotency:*",
+        "clean_inactive:*",
+    ):
+        cache.delete_pattern(pattern)
@@ -0,0 +1,212 @@
+import hashlib
+import hmac
+import json
+import logging
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+INTENT_PATH = re.compile(r"^/v1/payment_intents/(?P<id>[\w-]+)(?P<cancel>/cancel)?$")
+
+
+# Stand-in for the Stripe API endpoints used by checkout, point STRIPE_API_BASE at it
+# Intents are paid confirm_after seconds after creation, or declined at decline_rate,
+# and the outcome is sent to webhook_url signed with webhook_secret like Stripe does.
+# Every call waits latency +- jitter ms and fails with a 500 at failure_rate.
+class FakeStripe(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        webhook_url=None,
+        webhook_secret="",
+        latency=0,
+        jitter=0,
+        failure_rate=0,
+        decline_rate=0,
+        confirm_after=1,
+    ):
+        super().__init__(address, FakeStripeHandler)
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.confirm_after = confirm_after
+
+        self.intents = {}
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def create_intent(self, params):
+        intent_id = f"pi_fake_{secrets.token_hex(12)}"
+        intent = {
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(params.get("amount", 0)),
+            "currency": params.get("currency", "usd"),
+            "status": "requires_payment_method",
+            "client_secret": f"{intent_id}_secret_{secrets.token_hex(12)}",
+            "metadata": {
+                key[len("metadata[") : -1]: value
+                for key, value in params.items()
+                if key.startswith("metadata[")
+            },
+            "created": int(time.time()),
+        }
+        self.intents[intent_id] = intent
+
+        if self.confirm_after is not None:
+            timer = threading.Timer(self.confirm_after, self.confirm, [intent_id])
+            timer.daemon = True
+            timer.start()
+        return intent
+
+    # Settle the payment the way a buyer confirming on the frontend would
+    def confirm(self, intent_id):
+        with self.lock:
+            intent = self.intents[intent_id]
+            if intent["status"] != "requires_payment_method":
+                return
+
+            if random.random() < self.decline_rate:
+                event_type = "payment_intent.payment_failed"
+            else:
+                intent["status"] = "succeeded"
+                event_type = "payment_intent.succeeded"
+            event = self.event(event_type, dict(intent))
+
+        self.send_webhook(event)
+
+    def event(self, event_type, data):
+        return {
+            "id": f"evt_fake_{secrets.token_hex(12)}",
+            "object": "event",
+            "type": event_type,
+            "created": int(time.time()),
+            "data": {"object": data},
+        }
+
+    # Payload and Stripe-Signature header of an event
+    def sign(self, event):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            self.webhook_secret.encode(),
+            f"{timestamp}.{payload}".encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        return payload, f"t={timestamp},v1={signature}"
+
+    def send_webhook(self, event):
+        if not self.webhook_url:
+            return
+
+        payload, signature = self.sign(event)
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=payload.encode(),
+            headers={"Content-Type": "application/json", "Stripe-Signature": signature},
+        )
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except OSError as error:
+            logger.warning(f"Webhook {event['id']} failed: {error}")
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.handle_call(self.route_get)
+
+    def do_POST(self):
+        self.handle_call(self.route_post)
+
+    def handle_call(self, route):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode()))
+
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        time.sleep(max(0, delay) / 1000)
+
+        if random.random() < server.failure_rate:
+            return self.respond(500, error("api_error", "Simulated failure."))
+
+        # Retried calls get the first response, like Stripe idempotent requests
+        key = self.headers.get("Idempotency-Key")
+        with server.lock:
+            if key and key in server.responses:
+                return self.respond(*server.responses[key])
+
+            response = route(params)
+            if key and self.command == "POST":
+                server.responses[key] = response
+        self.respond(*response)
+
+    def route_get(self, params):
+        match = INTENT_PATH.match(self.path)
+        if not match or match["cancel"]:
+            return 404, error("invalid_request_error", "Unrecognized request URL.")
+        return self.intent(match["id"])
+
+    def route_post(self, params):
+        if self.path == "/v1/payment_intents":
+            return 200, self.server.create_intent(params)
+
+        if self.path == "/v1/refunds":
+            status, intent = self.intent(params.get("payment_intent"))
+            if status != 200:
+                return status, intent
+            if intent["status"] == "refunded":
+                return 400, error(
+                    "invalid_request_error", "Charge has already been refunded."
+                )
+            intent["status"] = "refunded"
+            return 200, {
+                "id": f"re_fake_{secrets.token_hex(12)}",
+                "object": "refund",
+                "payment_intent": intent["id"],
+                "amount": intent["amount"],
+                "status": "succeeded",
+            }
+
+        match = INTENT_PATH.match(self.path)
+        if match and match["cancel"]:
+            status, intent = self.intent(match["id"])
+            if status == 200:
+                intent["status"] = "canceled"
+            return status, intent
+
+        return 404, error("invalid_request_error", "Unrecognized request URL.")
+
+    def intent(self, intent_id):
+        intent = self.server.intents.get(intent_id)
+        if intent is None:
+            return 404, error(
+                "invalid_request_error", f"No such payment_intent: '{intent_id}'"
+            )
+        return 200, intent
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def error(error_type, message):
+    return {"error": {"type": error_type, "message": message}}
@@ -0,0 +1,47 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q, FloatField
+from django.db.models.functions import Cast
+from rest_framework import filters
+
+from .models import User
+
+
+class ListingSearchFilter(filters.SearchFilter):
+    # Full text search over Listing.search_vector, ranked and matching word prefixes
+    def get_search_words(self, request):
+        words = [re.sub(r"\W", "", term) for term in self.get_search_terms(request)]
+        return [word for word in words if word]
+
+    def filter_queryset(self, request, queryset, view):
+        words = self.get_search_words(request)
+        if not words:
+            return queryset
+
+        query = SearchQuery(
+            " & ".join(f"{word}:*" for word in words),
+            search_type="raw",
+            config="english",
+        )
+
+        # Every term matches the listing text or the username of its seller
+        matches = Q()
+        for word in words:
+            matches &= Q(
+                search_vector=SearchQuery(
+                    f"{word}:*", search_type="raw", config="english"
+                )
+            ) | Q(seller__in=User.objects.filter(username__iexact=word))
+
+        # Double precision keeps the rank exact on keyset cursors
+        return queryset.filter(matches).annotate(
+            search_rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+
+
+class ListingOrderingFilter(filters.OrderingFilter):
+    # Search results are ordered by rank unless an ordering is requested
+    def get_default_ordering(self, view):
+        if ListingSearchFilter().get_search_words(view.request):
+            return ["-search_rank"]
+        return super().get_default_ordering(view)
@@ -0,0 +1,145 @@
+import codecs
+import csv
+import json
+import os
+from django.db import transaction
+
+from .caching import bump_listing_versions
+from .models import Listing
+from .serializers import ListingImportSerializer
+from .tasks import fetch_listing_images
+
+# Valid rows inserted per transaction, rows of a failed file before it stay imported
+IMPORT_BATCH = 500
+
+# Rows read from a file, and row errors reported, at most
+# Uploads are imported by a worker, IMPORT_MAX_ROWS keeps one job within the task
+# time limit, larger catalogs are split into several files
+IMPORT_MAX_ROWS = 50_000
+IMPORT_MAX_ERRORS = 1000
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+# Format of an import file from its name, None when unsupported
+def import_format(name):
+    return FORMATS.get(os.path.splitext(name or "")[1].lower())
+
+
+# Line a row couldn't be read from, reported like a row failing validation
+class RowError(Exception):
+    pass
+
+
+# Refuse a file opened in binary mode that isn't UTF-8 before any row is imported,
+# UTF-8 never splits a character across lines so it's checked a line at a time
+def check_encoding(file):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    line = 0
+    try:
+        for line, text in enumerate(file, 1):
+            decoder.decode(text)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise ValueError(f"Line {line or 1}: the file is not UTF-8 encoded.")
+    finally:
+        file.seek(0)
+
+
+# (line, row) of an import file opened in binary mode, read a line at a time
+# CSV rows hold their image urls in one cell separated by spaces
+# Unreadable lines give a RowError instead of a row, a CSV file isn't read past one
+def read_rows(file, format):
+    if format == "csv":
+        reader = csv.DictReader(codecs.iterdecode(file, "utf-8-sig"))
+        try:
+            for row in reader:
+                # Cells past the header are left out
+                row = {key: value for key, value in row.items() if key is not None}
+                if "image_urls" in row:
+                    row["image_urls"] = (row["image_urls"] or "").split()
+                yield reader.line_num, row
+        except (csv.Error, UnicodeDecodeError) as e:
+            # The line failing isn't counted yet
+            yield reader.line_num + 1, RowError(
+                f"Unreadable line, the rest of the file was skipped: {e}"
+            )
+        return
+
+    for line, data in enumerate(file, 1):
+        try:
+            text = data.decode("utf-8-sig" if line == 1 else "utf-8")
+        except UnicodeDecodeError:
+            yield line, RowError("Line is not UTF-8 encoded.")
+            continue
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError:
+            yield line, RowError("Line is not valid JSON.")
+
+
+# Validate rows with the listing rules and insert the valid ones in batches
+# Returns the rows created and failed, and the errors of the failed ones by line
+def import_listings(seller, rows):
+    report = {"created": 0, "failed": 0, "errors": []}
+    batch = []
+    read = 0
+
+    for line, row in rows:
+        read += 1
+        if read > IMPORT_MAX_ROWS:
+            report["errors"].append(
+                {
+                    "line": line,
+                    "errors": {
+                        "non_field_errors": [
+                            f"Imports are limited to {IMPORT_MAX_ROWS} rows."
+                        ]
+                    },
+                }
+            )
+            break
+
+        if isinstance(row, RowError):
+            errors = {"non_field_errors": [str(row)]}
+        elif not isinstance(row, dict):
+            errors = {"non_field_errors": ["Row must be a JSON object."]}
+        else:
+            serializer = ListingImportSerializer(data=row)
+            if serializer.is_valid():
+                data = dict(serializer.validated_data)
+                urls = data.pop("image_urls", [])
+                batch.append((Listing(seller=seller, **data), urls))
+
+                if len(batch) >= IMPORT_BATCH:
+                    report["created"] += create_listings(batch)
+                    batch = []
+                continue
+            errors = serializer.errors
+
+        report["failed"] += 1
+        if len(report["errors"]) < IMPORT_MAX_ERRORS:
+            report["errors"].append({"line": line, "errors": errors})
+
+    if batch:
+        report["created"] += create_listings(batch)
+    return report
+
+
+# Insert a batch of listings, their images are fetched once it commits
+@transaction.atomic
+def create_listings(batch):
+    listings = Listing.objects.bulk_create([listing for listing, _ in batch])
+    bump_listing_versions(listing.id for listing in listings)
+
+    images = [(str(listing.id), urls) for listing, urls in batch if urls]
+
+    def queue():
+        for listing_id, urls in images:
+            fetch_listing_images.delay(listing_id, urls)
+
+    if images:
+        transaction.on_commit(queue)
+    return len(listings)
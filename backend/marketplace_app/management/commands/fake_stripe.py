@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from marketplace_app.fake_stripe import FakeStripe
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local stand-in for the Stripe API to load test checkout offline. "
+        "Run the backend with STRIPE_API_BASE pointing at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="0.0.0.0")
+        parser.add_argument("--port", type=int, default=12111)
+        parser.add_argument(
+            "--webhook-url",
+            default="http://localhost:8000/api/webhook/stripe/",
+            help="Where payment outcomes are sent, signed with STRIPE_WEBHOOK_SECRET",
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0, help="Milliseconds added to each call"
+        )
+        parser.add_argument(
+            "--jitter", type=float, default=0, help="Random +- milliseconds of latency"
+        )
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0,
+            help="Share of calls answered with a 500, from 0 to 1",
+        )
+        parser.add_argument(
+            "--decline-rate",
+            type=float,
+            default=0,
+            help="Share of payments declined instead of paid, from 0 to 1",
+        )
+        parser.add_argument(
+            "--confirm-after",
+            type=float,
+            default=1,
+            help="Seconds until a created intent is paid or declined",
+        )
+
+    def handle(self, *args, **options):
+        server = FakeStripe(
+            (options["host"], options["port"]),
+            webhook_url=options["webhook_url"],
+            webhook_secret=settings.STRIPE_WEBHOOK_SECRET or "",
+            latency=options["latency"],
+            jitter=options["jitter"],
+            failure_rate=options["failure_rate"],
+            decline_rate=options["decline_rate"],
+            confirm_after=options["confirm_after"],
+        )
+        self.stdout.write(
+            f"Fake Stripe listening on {options['host']}:{options['port']}"
+        )
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
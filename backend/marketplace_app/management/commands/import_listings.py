@@ -0,0 +1,48 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from marketplace_app.imports import (
+    FORMATS,
+    check_encoding,
+    import_format,
+    import_listings,
+    read_rows,
+)
+from marketplace_app.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the listings of a seller from a CSV or JSONL file, reporting the "
+        "rows that failed validation. Images are fetched by the Celery workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file")
+        parser.add_argument("--seller", required=True, help="Username of the seller")
+        parser.add_argument(
+            "--format",
+            choices=sorted(set(FORMATS.values())),
+            help="Defaults to the file extension",
+        )
+
+    def handle(self, *args, **options):
+        seller = User.objects.filter(username=options["seller"], is_active=True).first()
+        if seller is None:
+            raise CommandError(f"No active user {options['seller']}.")
+
+        file_format = options["format"] or import_format(options["path"])
+        if file_format is None:
+            raise CommandError("Unsupported file format, use .csv or .jsonl.")
+
+        try:
+            with open(options["path"], "rb") as file:
+                check_encoding(file)
+                report = import_listings(seller, read_rows(file, file_format))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in report["errors"]:
+            self.stderr.write(f"Line {error['line']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            f"{report['created']} listings created, {report['failed']} rows failed"
+        )
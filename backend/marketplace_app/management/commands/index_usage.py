@@ -0,0 +1,57 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        "Report how often each index of the marketplace tables was scanned since "
+        "the statistics were last reset, from pg_stat_user_indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--unused",
+            action="store_true",
+            help="Only list non unique indexes never scanned, candidates to drop",
+        )
+
+    def handle(self, *args, **options):
+        tables = [
+            model._meta.db_table
+            for model in apps.get_app_config("marketplace_app").get_models()
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT stats_reset FROM pg_stat_database "
+                "WHERE datname = current_database()"
+            )
+            stats_reset = cursor.fetchone()[0]
+
+            cursor.execute(
+                """
+                SELECT stats.relname, stats.indexrelname, stats.idx_scan,
+                    stats.idx_tup_read, pg_size_pretty(pg_relation_size(stats.indexrelid)),
+                    index.indisunique
+                FROM pg_stat_user_indexes AS stats
+                JOIN pg_index AS index ON index.indexrelid = stats.indexrelid
+                WHERE stats.relname = ANY(%s)
+                ORDER BY stats.relname, stats.idx_scan, stats.indexrelname
+                """,
+                [tables],
+            )
+            rows = cursor.fetchall()
+
+        if options["unused"]:
+            rows = [row for row in rows if not row[2] and not row[5]]
+
+        self.stdout.write(f"Statistics since {stats_reset or 'the server started'}")
+        self.stdout.write(
+            f"{'table':<32} {'index':<56} {'scans':>10} {'tuples read':>12} {'size':>10}"
+        )
+        for table, index, scans, tuples, size, unique in rows:
+            flag = " unique" if unique else ""
+            self.stdout.write(
+                f"{table:<32} {index:<56} {scans:>10} {tuples:>12} {size:>10}{flag}"
+            )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from marketplace_app.models import StripeEvent
+from marketplace_app.services import process_stripe_events, replay_stripe_events
+from marketplace_app.tasks import consume_stripe_events
+
+
+class Command(BaseCommand):
+    help = "Run stored Stripe events again, by event id, order or failed status."
+
+    def add_arguments(self, parser):
+        parser.add_argument("event_ids", nargs="*", help="Stripe event ids")
+        parser.add_argument("--order", help="Replay every event of this order")
+        parser.add_argument(
+            "--failed", action="store_true", help="Replay every failed event"
+        )
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help="Queue the events on Celery instead of running them here",
+        )
+
+    def handle(self, *args, **options):
+        if not (options["event_ids"] or options["order"] or options["failed"]):
+            raise CommandError("Pass event ids, --order or --failed.")
+
+        events = StripeEvent.objects.all()
+        if options["event_ids"]:
+            events = events.filter(id__in=options["event_ids"])
+        if options["order"]:
+            events = events.filter(order_id=options["order"])
+        if options["failed"]:
+            events = events.filter(status=StripeEvent.EventStatus.FAILED)
+
+        for order_id in replay_stripe_events(events):
+            if options["queue"]:
+                consume_stripe_events.delay(str(order_id))
+                self.stdout.write(f"Order {order_id}: queued")
+            else:
+                processed = process_stripe_events(order_id)
+                self.stdout.write(f"Order {order_id}: {processed} events processed")
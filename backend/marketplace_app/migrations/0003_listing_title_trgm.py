@@ -0,0 +1,24 @@
+# Generated by Django 5.2.10 on 2026-10-17 06:13
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace_app", "0002_listing_search_vector_listing_listing_search_idx"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="listing",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["title"],
+                name="listing_title_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.10 on 2026-10-17 07:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace_app", "0003_listing_title_trgm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="listing",
+            name="main_image",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="marketplace_app.listingimage",
+            ),
+        ),
+        # Keep the oldest main image of each listing
+        migrations.RunSQL(
+            sql="""
+                UPDATE marketplace_app_listingimage SET is_main = FALSE
+                WHERE is_main AND id NOT IN (
+                    SELECT DISTINCT ON (listing_id) id
+                    FROM marketplace_app_listingimage
+                    WHERE is_main
+                    ORDER BY listing_id, id
+                );
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name="listingimage",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_main", True)),
+                fields=("listing",),
+                name="unique_main_image_per_listing",
+            ),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE marketplace_app_listing AS listing SET main_image_id = image.id
+                FROM marketplace_app_listingimage AS image
+                WHERE image.listing_id = listing.id AND image.is_main;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
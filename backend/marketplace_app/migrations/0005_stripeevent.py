@@ -0,0 +1,56 @@
+# Generated by Django 5.2.10 on 2026-10-17 06:34
+
+import django_prometheus.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace_app", "0004_listing_main_image"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripeEvent",
+            fields=[
+                (
+                    "id",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("type", models.CharField(max_length=255)),
+                ("order_id", models.UUIDField(blank=True, db_index=True, null=True)),
+                ("payload", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("P", "Pending"),
+                            ("D", "Processed"),
+                            ("F", "Failed"),
+                            ("I", "Ignored"),
+                        ],
+                        default="P",
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True, null=True)),
+                ("created", models.DateTimeField()),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["created", "received_at"],
+            },
+            bases=(
+                django_prometheus.models.ExportModelOperationsMixin("stripe-event"),
+                models.Model,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stripeevent",
+            index=models.Index(
+                fields=["status", "received_at"], name="stripe_event_status_idx"
+            ),
+        ),
+    ]
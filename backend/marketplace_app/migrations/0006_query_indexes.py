@@ -0,0 +1,187 @@
+# Generated by Django 5.2.10 on 2026-10-17 06:49
+
+import django.core.validators
+import django.db.models.deletion
+import marketplace_app.models
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking writes, before the ones they replace are dropped
+    atomic = False
+
+    dependencies = [
+        ("marketplace_app", "0005_stripeevent"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="listing",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["created_at", "id"],
+                name="listing_active_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="listing",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["price", "id"],
+                name="listing_active_price_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="listing",
+            index=models.Index(
+                fields=["seller", "created_at", "id"], name="listing_seller_created_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="listing",
+            index=models.Index(
+                condition=models.Q(("is_active", False)),
+                fields=["inactive_date"],
+                name="listing_inactive_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="order",
+            index=models.Index(
+                fields=["buyer", "created_at"], name="order_buyer_created_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("status", "P")),
+                fields=["created_at"],
+                name="order_pending_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="orderitem",
+            index=models.Index(
+                fields=["seller", "order"], name="orderitem_seller_order_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="cartitem",
+            name="cart",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="items",
+                to="marketplace_app.cart",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="listing",
+            name="id",
+            field=models.UUIDField(
+                default=marketplace_app.models.uuid7,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="listing",
+            name="seller",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="listings",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="listing",
+            name="title",
+            field=models.CharField(
+                max_length=255,
+                validators=[django.core.validators.MinLengthValidator(3)],
+            ),
+        ),
+        migrations.AlterField(
+            model_name="listingimage",
+            name="id",
+            field=models.UUIDField(
+                default=marketplace_app.models.uuid7,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="buyer",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="orders",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="id",
+            field=models.UUIDField(
+                default=marketplace_app.models.uuid7,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="orderitem",
+            name="seller",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="id",
+            field=models.UUIDField(
+                default=marketplace_app.models.uuid7,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="email",
+            field=models.EmailField(
+                max_length=254,
+                unique=True,
+                validators=[
+                    django.core.validators.EmailValidator(
+                        message="Please provide a valid email."
+                    )
+                ],
+            ),
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="username",
+            field=models.CharField(
+                max_length=150,
+                unique=True,
+                validators=[
+                    django.core.validators.MinLengthValidator(3),
+                    django.core.validators.RegexValidator(
+                        message="Username can only contain letters, numbers, underscores or dots.",
+                        regex="^[\\w.@+-]+$",
+                    ),
+                ],
+            ),
+        ),
+    ]
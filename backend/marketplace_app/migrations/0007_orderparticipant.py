@@ -0,0 +1,75 @@
+# Generated by Django 5.2.10 on 2026-10-17 06:52
+
+import django.db.models.deletion
+import django_prometheus.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace_app", "0006_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderParticipant",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("role", models.CharField(choices=[("B", "Buyer"), ("S", "Seller")])),
+            ],
+            bases=(
+                django_prometheus.models.ExportModelOperationsMixin(
+                    "order-participant"
+                ),
+                models.Model,
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderparticipant",
+            name="order",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="participants",
+                to="marketplace_app.order",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderparticipant",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="orderparticipant",
+            constraint=models.UniqueConstraint(
+                fields=("user", "role", "order"), name="order_participant_unique"
+            ),
+        ),
+        # Buyers and sellers of the existing orders
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO marketplace_app_orderparticipant (order_id, user_id, role)
+                SELECT id, buyer_id, 'B' FROM marketplace_app_order
+                WHERE buyer_id IS NOT NULL
+                UNION
+                SELECT order_id, seller_id, 'S' FROM marketplace_app_orderitem
+                WHERE seller_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
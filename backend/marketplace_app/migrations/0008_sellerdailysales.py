@@ -0,0 +1,65 @@
+# Generated by Django 5.2.10 on 2026-10-17 06:58
+
+import django.db.models.deletion
+import django_prometheus.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace_app", "0007_orderparticipant"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SellerDailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("units", models.IntegerField(default=0)),
+                ("orders", models.IntegerField(default=0)),
+                ("items_awaiting_shipment", models.IntegerField(default=0)),
+                ("items_in_transit", models.IntegerField(default=0)),
+                ("items_delivered", models.IntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["day"],
+            },
+            bases=(
+                django_prometheus.models.ExportModelOperationsMixin(
+                    "seller-daily-sales"
+                ),
+                models.Model,
+            ),
+        ),
+        migrations.AddField(
+            model_name="sellerdailysales",
+            name="seller",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="sellerdailysales",
+            constraint=models.UniqueConstraint(
+                fields=("seller", "day"), name="seller_daily_sales_unique"
+            ),
+        ),
+    ]
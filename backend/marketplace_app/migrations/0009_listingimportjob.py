@@ -0,0 +1,75 @@
+# Generated by Django 5.2.10 on 2026-10-17 08:00
+
+import django.db.models.deletion
+import django_prometheus.models
+import marketplace_app.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace_app", "0008_sellerdailysales"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ListingImportJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=marketplace_app.models.uuid7,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        blank=True,
+                        max_length=500,
+                        null=True,
+                        upload_to=marketplace_app.models.listing_import_upload,
+                    ),
+                ),
+                ("format", models.CharField(max_length=10)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("P", "Pending"),
+                            ("R", "Running"),
+                            ("D", "Done"),
+                            ("F", "Failed"),
+                        ],
+                        default="P",
+                    ),
+                ),
+                ("report", models.JSONField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+            bases=(
+                django_prometheus.models.ExportModelOperationsMixin(
+                    "listing-import-job"
+                ),
+                models.Model,
+            ),
+        ),
+        migrations.AddField(
+            model_name="listingimportjob",
+            name="seller",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="listing_imports",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
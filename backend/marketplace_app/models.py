@@ -2,6 +2,8 @@ import os
 import uuid6
 from decimal import Decimal
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import (
     MinValueValidator,
     EmailValidator,
@@ -15,9 +17,13 @@ from django.utils import timezone
 from versatileimagefield.fields import VersatileImageField
 from django_prometheus.models import ExportModelOperationsMixin
 
+from .caching import bump_listing_versions
 from .utils import validate_image
 
 
+NO_IMAGE_URL = "https://placehold.co/600x400/e2e8f0/475569?text=No+Image+Available"
+
+
 def uuid7():
     return uuid6.uuid7()
 
@@ -38,16 +44,19 @@ def listing_image_upload(instance, filename):
     )
 
 
+def listing_import_upload(instance, filename):
+    ext = filename.split(".")[-1]
+    new_filename = f"{instance.id}.{ext}"
+    return os.path.join("users", str(instance.seller_id), "imports", new_filename)
+
+
 class User(ExportModelOperationsMixin("user"), AbstractUser):
-    id = models.UUIDField(
-        primary_key=True, default=uuid7, editable=False, unique=True, db_index=True
-    )
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
 
     username = models.CharField(
         max_length=150,
         unique=True,
         blank=False,
-        db_index=True,
         validators=[
             MinLengthValidator(3),
             RegexValidator(
@@ -59,7 +68,6 @@ class User(ExportModelOperationsMixin("user"), AbstractUser):
 
     email = models.EmailField(
         unique=True,
-        db_index=True,
         validators=[EmailValidator(message="Please provide a valid email.")],
     )
 
@@ -101,7 +109,9 @@ class User(ExportModelOperationsMixin("user"), AbstractUser):
         self.is_active = False
         self.inactive_date = timezone.now()
         self.save()
-        self.listings.filter(is_active=True).update(is_active=False)
+        listings = self.listings.filter(is_active=True)
+        bump_listing_versions(listings.values_list("id", flat=True))
+        listings.update(is_active=False)
 
 
 class Listing(ExportModelOperationsMixin("listing"), models.Model):
@@ -109,16 +119,20 @@ class Listing(ExportModelOperationsMixin("listing"), models.Model):
         IN_STOCK = "IS", "In Stock"
         OUT_OF_STOCK = "OOS", "Out of Stock"
 
-    id = models.UUIDField(
-        primary_key=True, default=uuid7, editable=False, unique=True, db_index=True
-    )
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
 
+    # Indexed by listing_seller_created_idx
     seller = models.ForeignKey(
-        "User", related_name="listings", blank=False, on_delete=models.CASCADE
+        "User",
+        related_name="listings",
+        blank=False,
+        on_delete=models.CASCADE,
+        db_index=False,
     )
 
+    # Searched through search_vector and listing_title_trgm_idx
     title = models.CharField(
-        blank=False, db_index=True, max_length=255, validators=[MinLengthValidator(3)]
+        blank=False, max_length=255, validators=[MinLengthValidator(3)]
     )
 
     status = models.CharField(
@@ -140,10 +154,57 @@ class Listing(ExportModelOperationsMixin("listing"), models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     quantity = models.PositiveIntegerField(default=1)
 
+    # Kept in sync with ListingImage.is_main by the listing services
+    main_image = models.ForeignKey(
+        "ListingImage",
+        related_name="+",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+
+    # Title ranks above description on search
+    search_vector = models.GeneratedField(
+        expression=SearchVector("title", weight="A", config="english")
+        + SearchVector("description", weight="B", config="english"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="listing_search_idx"),
+            GinIndex(
+                fields=["title"], opclasses=["gin_trgm_ops"], name="listing_title_trgm_idx"
+            ),
+            # Browse pages, keyset paginated over (ordering field, id)
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(is_active=True),
+                name="listing_active_created_idx",
+            ),
+            models.Index(
+                fields=["price", "id"],
+                condition=models.Q(is_active=True),
+                name="listing_active_price_idx",
+            ),
+            # Seller profiles
+            models.Index(
+                fields=["seller", "created_at", "id"], name="listing_seller_created_idx"
+            ),
+            # Purge of inactive listings
+            models.Index(
+                fields=["inactive_date"],
+                condition=models.Q(is_active=False),
+                name="listing_inactive_idx",
+            ),
+        ]
+
     def soft_delete(self):
         self.is_active = not self.is_active
         self.inactive_date = timezone.now()
         self.save()
+        bump_listing_versions([self.id])
         return self.is_active
 
     @property
@@ -152,17 +213,14 @@ class Listing(ExportModelOperationsMixin("listing"), models.Model):
         return max(0, self.quantity - reserved)
 
     @property
-    def main_image(self) -> str:
-        image = self.images.filter(is_main=True).first()
-        if image:
-            return image.image.url
-        return "https://placehold.co/600x400/e2e8f0/475569?text=No+Image+Available"
+    def main_image_url(self) -> str:
+        if self.main_image_id:
+            return self.main_image.image.url
+        return NO_IMAGE_URL
 
 
 class ListingImage(ExportModelOperationsMixin("listing-image"), models.Model):
-    id = models.UUIDField(
-        primary_key=True, default=uuid7, editable=False, unique=True, db_index=True
-    )
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
 
     listing = models.ForeignKey(
         "Listing", related_name="images", on_delete=models.CASCADE
@@ -176,6 +234,13 @@ class ListingImage(ExportModelOperationsMixin("listing-image"), models.Model):
 
     class Meta:
         ordering = ["-is_main", "id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["listing"],
+                condition=models.Q(is_main=True),
+                name="unique_main_image_per_listing",
+            )
+        ]
 
 
 class Cart(ExportModelOperationsMixin("cart"), models.Model):
@@ -183,7 +248,10 @@ class Cart(ExportModelOperationsMixin("cart"), models.Model):
 
 
 class CartItem(ExportModelOperationsMixin("cart-item"), models.Model):
-    cart = models.ForeignKey("cart", on_delete=models.CASCADE, related_name="items")
+    # Indexed by the (cart, listing) unique constraint
+    cart = models.ForeignKey(
+        "cart", on_delete=models.CASCADE, related_name="items", db_index=False
+    )
 
     listing = models.ForeignKey(
         "listing", on_delete=models.CASCADE, related_name="cart_items"
@@ -206,12 +274,15 @@ class Order(ExportModelOperationsMixin("order"), models.Model):
         PAID = "A", "Paid"
         CANCELLED = "C", "Cancelled"
 
-    id = models.UUIDField(
-        primary_key=True, default=uuid7, editable=False, unique=True, db_index=True
-    )
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
 
+    # Indexed by order_buyer_created_idx
     buyer = models.ForeignKey(
-        "user", on_delete=models.SET_NULL, null=True, related_name="orders"
+        "user",
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="orders",
+        db_index=False,
     )
 
     total_price = models.DecimalField(decimal_places=2, max_digits=10)
@@ -228,6 +299,18 @@ class Order(ExportModelOperationsMixin("order"), models.Model):
 
     class Meta:
         ordering = ["id"]
+        indexes = [
+            # Buyer order history
+            models.Index(
+                fields=["buyer", "created_at"], name="order_buyer_created_idx"
+            ),
+            # Sweep of expired pending orders
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status="P"),
+                name="order_pending_created_idx",
+            ),
+        ]
 
 
 class OrderItem(ExportModelOperationsMixin("order-item"), models.Model):
@@ -243,7 +326,10 @@ class OrderItem(ExportModelOperationsMixin("order-item"), models.Model):
 
     listing = models.ForeignKey("listing", on_delete=models.SET_NULL, null=True)
 
-    seller = models.ForeignKey("user", on_delete=models.SET_NULL, null=True)
+    # Indexed by orderitem_seller_order_idx
+    seller = models.ForeignKey(
+        "user", on_delete=models.SET_NULL, null=True, db_index=False
+    )
 
     status = models.CharField(
         choices=ShippingStatus.choices, default=ShippingStatus.AWAITING_PAYMENT
@@ -258,8 +344,140 @@ class OrderItem(ExportModelOperationsMixin("order-item"), models.Model):
     snapshot_listing_title = models.CharField(max_length=255)
     quantity = models.PositiveIntegerField()
 
+    class Meta:
+        indexes = [
+            # Seller orders
+            models.Index(fields=["seller", "order"], name="orderitem_seller_order_idx")
+        ]
+
     @property
     def listing_image(self):
         if self.listing:
-            return self.listing.main_image
-        return "https://placehold.co/600x400/e2e8f0/475569?text=No+Image+Available"
+            return self.listing.main_image_url
+        return NO_IMAGE_URL
+
+
+# Users taking part in an order, written with the order so the orders of a user
+# are read from (user, role, order) without joining and deduplicating the items
+class OrderParticipant(ExportModelOperationsMixin("order-participant"), models.Model):
+    class Role(models.TextChoices):
+        BUYER = "B", "Buyer"
+        SELLER = "S", "Seller"
+
+    order = models.ForeignKey(
+        "order", on_delete=models.CASCADE, related_name="participants"
+    )
+
+    # Indexed by order_participant_unique
+    user = models.ForeignKey(
+        "user", on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+
+    role = models.CharField(choices=Role.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "role", "order"], name="order_participant_unique"
+            )
+        ]
+
+
+# Sales of a seller per day their orders were placed, counting the items paid and
+# not cancelled. Kept up to date by the order services through analytics.roll_up_items
+# and rebuilt from the order items by the backfill_seller_sales task.
+class SellerDailySales(ExportModelOperationsMixin("seller-daily-sales"), models.Model):
+    # Indexed by seller_daily_sales_unique
+    seller = models.ForeignKey(
+        "user", on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+
+    day = models.DateField()
+
+    revenue = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    # Items sold by shipping status
+    items_awaiting_shipment = models.IntegerField(default=0)
+    items_in_transit = models.IntegerField(default=0)
+    items_delivered = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["seller", "day"], name="seller_daily_sales_unique"
+            )
+        ]
+
+
+class StripeEvent(ExportModelOperationsMixin("stripe-event"), models.Model):
+    class EventStatus(models.TextChoices):
+        PENDING = "P", "Pending"
+        PROCESSED = "D", "Processed"
+        FAILED = "F", "Failed"
+        IGNORED = "I", "Ignored"
+
+    # Stripe event id, so retries of an event are stored once
+    id = models.CharField(primary_key=True, max_length=255)
+
+    type = models.CharField(max_length=255)
+
+    # Not a foreign key, the metadata of an event is not trusted to match an order
+    order_id = models.UUIDField(null=True, blank=True, db_index=True)
+
+    payload = models.JSONField()
+
+    status = models.CharField(
+        choices=EventStatus.choices, default=EventStatus.PENDING
+    )
+
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    # When Stripe created the event, events of an order are processed in this order
+    created = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created", "received_at"]
+        indexes = [
+            models.Index(fields=["status", "received_at"], name="stripe_event_status_idx")
+        ]
+
+
+# Listing file uploaded for import, imported by a worker and reported when done
+class ListingImportJob(ExportModelOperationsMixin("listing-import-job"), models.Model):
+    class JobStatus(models.TextChoices):
+        PENDING = "P", "Pending"
+        RUNNING = "R", "Running"
+        DONE = "D", "Done"
+        FAILED = "F", "Failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+
+    seller = models.ForeignKey(
+        "user", on_delete=models.CASCADE, related_name="listing_imports"
+    )
+
+    # Emptied once imported, the stored file is then deleted
+    file = models.FileField(
+        upload_to=listing_import_upload, max_length=500, null=True, blank=True
+    )
+    format = models.CharField(max_length=10)
+
+    status = models.CharField(
+        choices=JobStatus.choices, default=JobStatus.PENDING
+    )
+
+    # Created and failed rows, like the import command reports them
+    report = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
@@ -0,0 +1,104 @@
+import json
+import uuid
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework import exceptions
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor
+
+
+class KeysetPagination(CursorPagination):
+    # Keyset over (ordering field, id), ids are uuid7 so they break ties in time order
+    page_size = 24
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "-created_at"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        # Pages are keyed by a single field and the id
+        self.ordering = self.get_ordering(request, queryset, view)
+        if len(self.ordering) > 1:
+            raise exceptions.ValidationError(
+                {"ordering": "Results can be ordered by a single field."}
+            )
+        self.cursor = self.decode_cursor(request)
+
+        field = self.ordering[0].lstrip("-")
+        descending = self.ordering[0].startswith("-")
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        # Walk backwards for previous pages
+        if reverse:
+            descending = not descending
+
+        direction = "-" if descending else ""
+        queryset = queryset.order_by(f"{direction}{field}", f"{direction}id")
+
+        if self.cursor and self.cursor.position is not None:
+            value, last_id = self._decode_position(
+                self.cursor.position, self._ordering_field(queryset, field)
+            )
+            lookup = "lt" if descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{field}__{lookup}": value})
+                | Q(**{field: value, f"id__{lookup}": last_id})
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        field = ordering[0].lstrip("-")
+        value = getattr(instance, field)
+        value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+        return json.dumps([value, str(instance.id)])
+
+    def _ordering_field(self, queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    # Cursor values are checked before reaching the query, a tampered cursor is a 404
+    def _decode_position(self, position, field):
+        try:
+            value, last_id = json.loads(position)
+            value = field.to_python(value)
+            last_id = uuid.UUID(last_id)
+        except (TypeError, ValueError, AttributeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, last_id
@@ -0,0 +1,255 @@
+import abc
+import functools
+import ssl
+import time
+import requests
+import stripe
+from asgiref.sync import sync_to_async
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils.module_loading import import_string
+from prometheus_client import Histogram
+
+PAYMENT_CALL_SECONDS = Histogram(
+    "marketplace_payment_call_seconds",
+    "Payment gateway call latency, retries included",
+    ["operation", "result"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16),
+)
+
+# Intents not paid yet are cancelled instead of refunded
+REFUNDABLE_BY_CANCEL = ["requires_payment_method", "requires_confirmation"]
+
+
+class PaymentError(Exception):
+    pass
+
+
+class InvalidWebhook(PaymentError):
+    pass
+
+
+@contextmanager
+def observe(operation):
+    start = time.perf_counter()
+    result = "error"
+    try:
+        yield
+        result = "ok"
+    finally:
+        PAYMENT_CALL_SECONDS.labels(operation, result).observe(
+            time.perf_counter() - start
+        )
+
+
+# Payment provider calls made by the order services, picked by PAYMENT_GATEWAY
+# Intents are returned as dicts so gateways don't leak their client objects
+# The _async variants, for ASGI views, run the sync calls on a thread unless a
+# gateway has its own
+class PaymentGateway(abc.ABC):
+    @abc.abstractmethod
+    def create_intent(self, amount, metadata, idempotency_key):
+        pass
+
+    @abc.abstractmethod
+    def retrieve_intent(self, intent_id):
+        pass
+
+    # Refund a paid intent, or cancel it while it can still be paid
+    @abc.abstractmethod
+    def refund_intent(self, intent_id):
+        pass
+
+    # Verified webhook event, raises InvalidWebhook
+    @abc.abstractmethod
+    def construct_event(self, payload, signature):
+        pass
+
+    async def create_intent_async(self, amount, metadata, idempotency_key):
+        return await sync_to_async(self.create_intent)(
+            amount, metadata, idempotency_key
+        )
+
+    async def retrieve_intent_async(self, intent_id):
+        return await sync_to_async(self.retrieve_intent)(intent_id)
+
+    async def refund_intent_async(self, intent_id):
+        return await sync_to_async(self.refund_intent)(intent_id)
+
+
+# HTTPX client of Stripe with its connection pool sized like the sync one
+class PooledHTTPXClient(stripe.HTTPXClient):
+    def __init__(self, pool_size, **kwargs):
+        super().__init__(**kwargs)
+        self._client_async = self.httpx.AsyncClient(
+            verify=ssl.create_default_context(cafile=stripe.ca_bundle_path),
+            limits=self.httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+
+
+# Stripe calls share one pooled HTTP session per process, give up after
+# STRIPE_CONNECT_TIMEOUT / STRIPE_READ_TIMEOUT, and are retried by the Stripe client
+# with exponential backoff and jitter up to STRIPE_MAX_RETRIES times.
+# Retried POSTs reuse their idempotency key so they can't charge twice.
+# The _async variants do the same on a pooled HTTPX client, used from one event loop.
+class StripeGateway(PaymentGateway):
+    def __init__(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        self.client = self.make_client(
+            stripe.RequestsClient(
+                timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+                session=session,
+            )
+        )
+
+    # Only ASGI views need it, built on first use
+    @functools.cached_property
+    def async_client(self):
+        import httpx
+
+        return self.make_client(
+            PooledHTTPXClient(
+                pool_size=settings.STRIPE_POOL_SIZE,
+                timeout=httpx.Timeout(
+                    settings.STRIPE_READ_TIMEOUT,
+                    connect=settings.STRIPE_CONNECT_TIMEOUT,
+                ),
+            )
+        )
+
+    def make_client(self, http_client):
+        # Point the client at a local stand-in such as the fake_stripe command
+        base_addresses = None
+        if settings.STRIPE_API_BASE:
+            base_addresses = {"api": settings.STRIPE_API_BASE}
+
+        return stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY or "",
+            http_client=http_client,
+            max_network_retries=settings.STRIPE_MAX_RETRIES,
+            base_addresses=base_addresses,
+        )
+
+    def create_intent(self, amount, metadata, idempotency_key):
+        with observe("create_intent"):
+            try:
+                intent = self.client.v1.payment_intents.create(
+                    params=intent_params(amount, metadata),
+                    options={"idempotency_key": idempotency_key},
+                )
+            except stripe.error.StripeError as error:
+                raise PaymentError(str(error))
+
+        return {"id": intent.id, "client_secret": intent.client_secret}
+
+    async def create_intent_async(self, amount, metadata, idempotency_key):
+        with observe("create_intent"):
+            try:
+                intent = await self.async_client.v1.payment_intents.create_async(
+                    params=intent_params(amount, metadata),
+                    options={"idempotency_key": idempotency_key},
+                )
+            except stripe.error.StripeError as error:
+                raise PaymentError(str(error))
+
+        return {"id": intent.id, "client_secret": intent.client_secret}
+
+    def retrieve_intent(self, intent_id):
+        with observe("retrieve_intent"):
+            try:
+                intent = self.client.v1.payment_intents.retrieve(intent_id)
+            except stripe.error.StripeError as error:
+                raise PaymentError(str(error))
+
+        return intent_status(intent_id, intent)
+
+    async def retrieve_intent_async(self, intent_id):
+        with observe("retrieve_intent"):
+            try:
+                intent = await self.async_client.v1.payment_intents.retrieve_async(
+                    intent_id
+                )
+            except stripe.error.StripeError as error:
+                raise PaymentError(str(error))
+
+        return intent_status(intent_id, intent)
+
+    def refund_intent(self, intent_id):
+        intents = self.client.v1.payment_intents
+        with observe("refund_intent"):
+            try:
+                intent = intents.retrieve(intent_id)
+
+                if intent.status == "succeeded":
+                    self.client.v1.refunds.create(params={"payment_intent": intent_id})
+
+                elif intent.status in REFUNDABLE_BY_CANCEL:
+                    intents.cancel(intent_id)
+            except stripe.error.StripeError as error:
+                if "already been refunded" not in str(error).lower():
+                    raise PaymentError(str(error))
+
+    async def refund_intent_async(self, intent_id):
+        intents = self.async_client.v1.payment_intents
+        with observe("refund_intent"):
+            try:
+                intent = await intents.retrieve_async(intent_id)
+
+                if intent.status == "succeeded":
+                    await self.async_client.v1.refunds.create_async(
+                        params={"payment_intent": intent_id}
+                    )
+
+                elif intent.status in REFUNDABLE_BY_CANCEL:
+                    await intents.cancel_async(intent_id)
+            except stripe.error.StripeError as error:
+                if "already been refunded" not in str(error).lower():
+                    raise PaymentError(str(error))
+
+    def construct_event(self, payload, signature):
+        try:
+            return stripe.Webhook.construct_event(
+                payload, signature, settings.STRIPE_WEBHOOK_SECRET
+            )
+        except (ValueError, stripe.error.SignatureVerificationError) as error:
+            raise InvalidWebhook(str(error))
+
+
+def intent_params(amount, metadata):
+    return {
+        "amount": amount,
+        "currency": "usd",
+        "metadata": {key: str(value) for key, value in metadata.items()},
+    }
+
+
+def intent_status(intent_id, intent):
+    return {
+        "id": intent_id,
+        "amount": intent.amount,
+        "status": intent.status,
+        "client_secret": intent.client_secret,
+    }
+
+
+# Longest a gateway call may take, every attempt timing out and the retries
+# backing off as long as the Stripe client allows
+def max_call_seconds():
+    attempts = settings.STRIPE_MAX_RETRIES + 1
+    return (
+        attempts * (settings.STRIPE_CONNECT_TIMEOUT + settings.STRIPE_READ_TIMEOUT)
+        + settings.STRIPE_MAX_RETRIES * stripe.HTTPClient.MAX_DELAY
+    )
+
+
+@functools.cache
+def payment_gateway():
+    return import_string(settings.PAYMENT_GATEWAY)()
@@ -1,7 +1,7 @@
 from drf_spectacular.utils import extend_schema, OpenApiExample, inline_serializer, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 from rest_framework import serializers
-from .serializers import RegisterSerializer, ChangePasswordSerializer, OrderSerializer, ListingSerializer, CartSerializer, CartItemSerializer
+from .serializers import RegisterSerializer, ChangePasswordSerializer, OrderSerializer, ListingSerializer, ListingImportJobSerializer, ListingSuggestionSerializer, CartSerializer, CartItemSerializer, SellerSalesQuerySerializer, SellerSalesSerializer, ShipItemsSerializer, ShipItemsResultSerializer
 
 
 PAYMENT_STATUS = """
@@ -225,6 +225,57 @@ USER_VIEWSET_SCHEMAS = {
             ),
         ]
     ),
+    'sales': extend_schema(
+        summary='My Sales',
+        description=(
+            'Daily sales of the current user as a seller, by the day orders were placed, '
+            'and their totals over the range. Only paid items that were not cancelled count. '
+            'Defaults to the last 30 days, ranges are limited to 366 days.'
+        ),
+        parameters=[SellerSalesQuerySerializer],
+        responses={
+            200: SellerSalesSerializer,
+            400: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                'Sales Response',
+                value={
+                    'start': '2026-01-01',
+                    'end': '2026-01-02',
+                    'totals': {
+                        'revenue': '150.00',
+                        'units': 3,
+                        'orders': 2,
+                        'items_awaiting_shipment': 1,
+                        'items_in_transit': 1,
+                        'items_delivered': 0,
+                    },
+                    'days': [
+                        {
+                            'day': '2026-01-02',
+                            'revenue': '150.00',
+                            'units': 3,
+                            'orders': 2,
+                            'items_awaiting_shipment': 1,
+                            'items_in_transit': 1,
+                            'items_delivered': 0,
+                        }
+                    ],
+                },
+                response_only=True,
+                status_codes=['200'],
+            ),
+            OpenApiExample(
+                'Invalid Range',
+                value={'start': ['Start is after end.']},
+                response_only=True,
+                status_codes=['400'],
+            ),
+        ],
+        tags=['Users'],
+        auth=[{'jwt': []}],
+    ),
     'me_get': extend_schema(
         summary='View My Profile',
         description='Returns the private data of the currently logged-in user.',
@@ -265,7 +316,16 @@ LISTING_SCHEMAS = {
     ),
     'retrieve': extend_schema(
         summary='Get Listing Details',
-        description=f'Return listing full data. \n\n{LISTING_STATUS}',
+        description=f'Return listing full data. Send the returned ETag as If-None-Match to get a 304 when unchanged. \n\n{LISTING_STATUS}',
+        parameters=[
+            OpenApiParameter(
+                name='If-None-Match',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                description='ETag of a previous response.'
+            ),
+        ],
+        responses={200: ListingSerializer, 304: None},
         tags=['Listings'],
         auth=[],
     ),
@@ -280,6 +340,133 @@ LISTING_SCHEMAS = {
         tags=['Listings'],
         auth=[{'jwt': []}],
     ),
+    'bulk_import': extend_schema(
+        summary='Import Listings',
+        description=(
+            'Creates listings of the current user from a UTF-8 CSV or JSONL file, read row by row. '
+            'Rows take `title`, `price`, `quantity`, `description` and `image_urls`, '
+            'space separated in a CSV cell or a list in JSONL, up to 10 urls. '
+            'Rows are checked like a created listing, valid rows are created and '
+            'invalid rows reported by line. Images are downloaded in the background. '
+            'The file is imported by a worker, up to 50000 rows, '
+            'larger catalogs are split into several files. '
+            'Returns the import job, its report is read from `/api/listings/import/{job_id}/`.'
+        ),
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {
+                    'file': {'type': 'string', 'format': 'binary'},
+                    'format': {
+                        'type': 'string',
+                        'enum': ['csv', 'jsonl'],
+                        'description': 'Defaults to the file extension.',
+                    },
+                },
+                'required': ['file'],
+            }
+        },
+        responses={
+            202: ListingImportJobSerializer,
+            400: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                'Queued Import',
+                value={
+                    'id': '019a0b6e-4c1f-7d2a-9a3e-2f6c1b8d5e70',
+                    'status': 'P',
+                    'report': None,
+                    'error': None,
+                    'created_at': '2026-01-01T12:00:00Z',
+                    'finished_at': None,
+                },
+                response_only=True,
+                status_codes=['202'],
+            ),
+            OpenApiExample(
+                'Unsupported File',
+                value={'detail': 'Unsupported file format, use .csv or .jsonl.'},
+                response_only=True,
+                status_codes=['400'],
+            ),
+        ],
+        tags=['Listings'],
+        auth=[{'jwt': []}],
+    ),
+    'import_status': extend_schema(
+        summary='Get Listing Import',
+        description=(
+            'An import job of the current user. '
+            'Status is `P` pending, `R` running, `D` done or `F` failed, '
+            'the report is set once done.'
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='job_id',
+                type=OpenApiTypes.UUID,
+                location=OpenApiParameter.PATH,
+            ),
+        ],
+        responses={200: ListingImportJobSerializer, 404: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                'Import Report',
+                value={
+                    'id': '019a0b6e-4c1f-7d2a-9a3e-2f6c1b8d5e70',
+                    'status': 'D',
+                    'report': {
+                        'created': 2,
+                        'failed': 1,
+                        'errors': [
+                            {'line': 3, 'errors': {'price': ['Ensure this value is greater than or equal to 0.01.']}},
+                        ],
+                    },
+                    'error': None,
+                    'created_at': '2026-01-01T12:00:00Z',
+                    'finished_at': '2026-01-01T12:00:04Z',
+                },
+                response_only=True,
+                status_codes=['200'],
+            ),
+        ],
+        tags=['Listings'],
+        auth=[{'jwt': []}],
+    ),
+    'autocomplete': extend_schema(
+        summary='Autocomplete Listing Titles',
+        description='Lightweight title suggestions for the search box. Matches anywhere in the title, prefix matches first.',
+        parameters=[
+            OpenApiParameter(
+                name='q',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description='Typed text, at least 2 characters.',
+                required=True,
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description='Max suggestions, default 8, up to 20.'
+            ),
+        ],
+        responses={200: ListingSuggestionSerializer(many=True)},
+        examples=[
+            OpenApiExample(
+                'Suggestions',
+                value={
+                    'id': '019bf8b8-9333-7826-8de4-59ecada9589c',
+                    'title': 'Vintage Camera',
+                    'price': '150.00',
+                    'main_image': 'https://example.com/image.jpg',
+                },
+                response_only=True,
+            ),
+        ],
+        tags=['Listings'],
+        auth=[],
+    ),
     'create': extend_schema(
         summary='Create Listing With Images Support',
         description='Handles images via multipart/form-data. Includes a manifest JSON mapping image data.',
@@ -401,7 +588,15 @@ ORDER_SCHEMAS = {
     ),
     'create': extend_schema(
         summary='Create Order Based on the User Current Cart',
-        description='Process the current cart to create a new order, optionally can receive an order_id, to handle the repay function.',
+        description='Process the current cart to create a new order, optionally can receive an order_id, to handle the repay function. Repeating a request with the same Idempotency-Key returns the first response instead of creating another order.',
+        parameters=[
+            OpenApiParameter(
+                name='Idempotency-Key',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                description='Unique key of this checkout attempt, kept for 24 hours.'
+            ),
+        ],
         request={
             'application/json': inline_serializer(
                 name='OrderCreateRequest',
@@ -420,6 +615,14 @@ ORDER_SCHEMAS = {
                 name='OrderError',
                 fields={'detail': serializers.CharField()}
             ),
+            409: inline_serializer(
+                name='OrderInProgressError',
+                fields={'detail': serializers.CharField()}
+            ),
+            422: inline_serializer(
+                name='OrderIdempotencyError',
+                fields={'detail': serializers.CharField()}
+            ),
         },
         examples=[
             OpenApiExample(
@@ -468,6 +671,45 @@ ORDER_SCHEMAS = {
         tags=['Orders'],
         auth=[{'jwt': []}],
     ),
+    'ship_items': extend_schema(
+        summary='Bulk Mark Items as Shipped',
+        description=(
+            'Sellers use this to provide tracking info for many of their items at once, '
+            'across orders. Up to 1000 items per request, each one awaiting shipment. '
+            f'Items that could not be shipped are reported in the results. \n\n{SHIPPING_STATUS}'
+        ),
+        request=ShipItemsSerializer,
+        responses={
+            200: ShipItemsResultSerializer,
+            400: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                'Bulk Shipping Request',
+                value={
+                    'items': [
+                        {'id': 1, 'tracking_code': 'tracking_123'},
+                        {'id': 2, 'tracking_code': 'tracking_456'},
+                    ],
+                },
+                request_only=True,
+            ),
+            OpenApiExample(
+                'Bulk Shipping Response',
+                value={
+                    'shipped': 1,
+                    'results': [
+                        {'id': 1, 'shipped': True},
+                        {'id': 2, 'shipped': False, 'error': 'Item is not awaiting shipment.'},
+                    ],
+                },
+                response_only=True,
+                status_codes=['200'],
+            ),
+        ],
+        tags=['Orders'],
+        auth=[{'jwt': []}],
+    ),
     'retrieve': extend_schema(
         summary='Get Order Details',
         description=f'Returns order data. If PENDING, includes a new client_secret for payment. \n\n{PAYMENT_STATUS}\n{SHIPPING_STATUS}',
@@ -1,14 +1,34 @@
 import stripe
+from datetime import timedelta
 from decimal import Decimal
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.core.validators import MinLengthValidator
 from django.conf import settings
-
-from .models import User, Listing, ListingImage, Cart, CartItem, Order, OrderItem
+from django.db.models import Manager
+
+from .models import (
+    User,
+    Listing,
+    ListingImage,
+    ListingImportJob,
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    SellerDailySales,
+)
+from .analytics import SALES_RANGE_DAYS, SALES_MAX_RANGE_DAYS, sales_day
+from .stock import reserved_stock
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+# Items a seller may ship in one bulk request
+SHIP_ITEMS_MAX = 1000
+
+# Images fetched per imported listing
+IMPORT_IMAGES_MAX = 10
+
 
 class CustomTokenObtainSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
@@ -93,6 +113,26 @@ class ChangePasswordSerializer(serializers.Serializer):
         return value
 
 
+class ReservedStockListSerializer(serializers.ListSerializer):
+    # Resolve the reserved stock of every listing on the page with a single MGET
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+
+        reserved = self.context.setdefault("reserved_stock", {})
+        listing_ids = [self.child.stock_listing_id(item) for item in items]
+        reserved.update(
+            reserved_stock(
+                [
+                    listing_id
+                    for listing_id in listing_ids
+                    if listing_id and listing_id not in reserved
+                ]
+            )
+        )
+
+        return super().to_representation(items)
+
+
 class ListingImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ListingImage
@@ -109,6 +149,17 @@ class ListingSerializer(serializers.ModelSerializer):
 
     seller = UserPublicSerializer(read_only=True)
     status_display = serializers.CharField(source="get_status_display", read_only=True)
+    available_stock = serializers.SerializerMethodField()
+
+    def stock_listing_id(self, obj):
+        return obj.id
+
+    def get_available_stock(self, obj) -> int:
+        # Use the stock resolved for the whole page, if any
+        reserved = self.context.get("reserved_stock", {})
+        if obj.id in reserved:
+            return max(0, obj.quantity - reserved[obj.id])
+        return obj.available_stock
 
     def validate_quantity(self, value):
         request = self.context.get("request")
@@ -139,6 +190,54 @@ class ListingSerializer(serializers.ModelSerializer):
             "status_display",
         ]
         read_only_fields = ["seller", "is_active"]
+        list_serializer_class = ReservedStockListSerializer
+
+
+# Rows of a listing import, images are fetched from their urls after the import
+class ListingImportSerializer(ListingSerializer):
+    image_urls = serializers.ListField(
+        child=serializers.URLField(max_length=500),
+        required=False,
+        max_length=IMPORT_IMAGES_MAX,
+    )
+
+    def validate_quantity(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Minimum quantity is 1.")
+        return value
+
+    class Meta(ListingSerializer.Meta):
+        fields = ["title", "price", "quantity", "description", "image_urls"]
+
+
+class ListingImportReportSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    errors = serializers.ListField(child=serializers.DictField())
+
+
+class ListingImportJobSerializer(serializers.ModelSerializer):
+    report = ListingImportReportSerializer(read_only=True, allow_null=True)
+
+    class Meta:
+        model = ListingImportJob
+        fields = ["id", "status", "report", "error", "created_at", "finished_at"]
+        read_only_fields = fields
+
+
+class ListingSuggestionSerializer(serializers.ModelSerializer):
+    main_image = serializers.SerializerMethodField()
+
+    def get_main_image(self, obj) -> str:
+        request = self.context.get("request")
+        image_url = obj.main_image_url
+        if image_url.startswith(("http://", "https://")):
+            return image_url
+        return request.build_absolute_uri(image_url) if request else image_url
+
+    class Meta:
+        model = Listing
+        fields = ["id", "title", "price", "main_image"]
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -148,6 +247,9 @@ class CartItemSerializer(serializers.ModelSerializer):
         queryset=Listing.objects.all(), source="listing", write_only=True
     )
 
+    def stock_listing_id(self, obj):
+        return obj.listing_id
+
     def validate(self, attrs):
         user = self.context["request"].user
         listing = attrs.get("listing") or getattr(self.instance, "listing", None)
@@ -165,6 +267,7 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ["id", "listing", "listing_id", "quantity", "added_at"]
+        list_serializer_class = ReservedStockListSerializer
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -223,11 +326,12 @@ class OrderSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source="get_status_display", read_only=True)
     user_role = serializers.SerializerMethodField()
 
+    # Both work over the prefetched items, so a page costs no extra queries
     def get_user_role(self, obj) -> str:
         user = self.context["request"].user
-        if obj.buyer == user:
+        if obj.buyer_id == user.id:
             return "buyer"
-        if obj.items.filter(seller=user).exists():
+        if any(item.seller_id == user.id for item in obj.items.all()):
             return "seller"
         return "none"
 
@@ -235,8 +339,8 @@ class OrderSerializer(serializers.ModelSerializer):
         user = self.context["request"].user
         items = obj.items.all()
 
-        if obj.buyer != user:
-            items = items.filter(seller=user)
+        if obj.buyer_id != user.id:
+            items = [item for item in items if item.seller_id == user.id]
 
         return OrderItemSerializer(items, many=True, context=self.context).data
 
@@ -255,3 +359,71 @@ class OrderSerializer(serializers.ModelSerializer):
             "user_role",
         ]
         read_only_fields = ["total_price", "id"]
+
+
+class SellerSalesTotalsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SellerDailySales
+        fields = [
+            "revenue",
+            "units",
+            "orders",
+            "items_awaiting_shipment",
+            "items_in_transit",
+            "items_delivered",
+        ]
+
+
+class SellerDailySalesSerializer(SellerSalesTotalsSerializer):
+    class Meta(SellerSalesTotalsSerializer.Meta):
+        fields = ["day"] + SellerSalesTotalsSerializer.Meta.fields
+
+
+class SellerSalesQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        end = attrs.get("end") or sales_day()
+        start = attrs.get("start") or end - timedelta(days=SALES_RANGE_DAYS - 1)
+
+        if start > end:
+            raise serializers.ValidationError({"start": "Start is after end."})
+        if (end - start).days >= SALES_MAX_RANGE_DAYS:
+            raise serializers.ValidationError(
+                {"start": f"Range is limited to {SALES_MAX_RANGE_DAYS} days."}
+            )
+        return {"start": start, "end": end}
+
+
+class SellerSalesSerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    totals = SellerSalesTotalsSerializer()
+    days = SellerDailySalesSerializer(many=True)
+
+
+class ShipItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1, max_value=2**63 - 1)
+    tracking_code = serializers.CharField(max_length=150)
+
+
+class ShipItemsSerializer(serializers.Serializer):
+    items = ShipItemSerializer(many=True, allow_empty=False, max_length=SHIP_ITEMS_MAX)
+
+    def validate_items(self, value):
+        ids = [item["id"] for item in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError("Items must be unique.")
+        return value
+
+
+class ShipItemResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    shipped = serializers.BooleanField()
+    error = serializers.CharField(required=False)
+
+
+class ShipItemsResultSerializer(serializers.Serializer):
+    shipped = serializers.IntegerField()
+    results = ShipItemResultSerializer(many=True)
@@ -1,10 +1,27 @@
 import json
-import stripe
-from django.db import transaction
-from django.db.models import Sum, F
+import uuid
+from datetime import datetime, timezone as dt_timezone
 from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum, F
 from django.shortcuts import get_object_or_404
-from .models import Order, Listing, User, ListingImage, Cart, OrderItem, CartItem
+from django.utils import timezone
+from .models import (
+    Order,
+    Listing,
+    User,
+    ListingImage,
+    Cart,
+    OrderItem,
+    OrderParticipant,
+    CartItem,
+    StripeEvent,
+    uuid7,
+)
+from .analytics import roll_up_items, sales_rows
+from .payments import PaymentError, payment_gateway
+from .stock import reserve_stock, release_stock, release_orders_stock, reserved_stock
+from .caching import PAYMENT_INTENT_TIMEOUT, single_flight, bump_listing_versions
 
 
 def register_user(validated_data):
@@ -25,17 +42,34 @@ def change_password(user, new_password):
     return user
 
 
+def _manifest_images(listing, files, manifest_json):
+    # Unsaved images from the upload manifest, the last one flagged is the main one
+    images, main = [], None
+    for item in json.loads(manifest_json if manifest_json else "[]"):
+        file = files.get(item["key"])
+        if file:
+            image = ListingImage(listing=listing, image=file)
+            if item.get("isMain", False):
+                main = image
+            images.append(image)
+    return images, main
+
+
+@transaction.atomic
 def create_listing(user, validated_data, files, manifest_json):
     listing = Listing.objects.create(seller=user, **validated_data)
-    manifest = json.loads(manifest_json if manifest_json else "[]")
+    images, main = _manifest_images(listing, files, manifest_json)
 
-    for item in manifest:
-        key = item["key"]
-        file = files.get(key)
-        if file:
-            is_main = item.get("isMain", False)
-            ListingImage.objects.create(listing=listing, image=file, is_main=is_main)
+    if images:
+        main = main or images[0]
+        for image in images:
+            image.is_main = image is main
+        ListingImage.objects.bulk_create(images)
 
+        listing.main_image = main
+        listing.save(update_fields=["main_image"])
+
+    bump_listing_versions([listing.id])
     return listing
 
 
@@ -44,7 +78,6 @@ def update_listing(instance, validated_data, files, request_data):
     # Update basic fields
     for attr, value in validated_data.items():
         setattr(instance, attr, value)
-    instance.save()
 
     # Handle quantity
     quantity = request_data.get("quantity")
@@ -54,45 +87,78 @@ def update_listing(instance, validated_data, files, request_data):
             if int(quantity) <= 0
             else Listing.ListingStatus.IN_STOCK
         )
-        instance.save(update_fields=["status"])
+
+    main_id = instance.main_image_id
 
     # Handle deleted images
     deleted_images = json.loads(request_data.get("deleted_images", "[]"))
     if deleted_images:
         instance.images.filter(id__in=deleted_images).delete()
+        if str(main_id) in deleted_images:
+            main_id = None
 
-    # Handle new images
-    manifest = json.loads(request_data.get("manifest", "[]"))
-    for item in manifest:
-        file = files.get(item["key"])
-        if file:
-            is_main = item.get("isMain", False)
-            if is_main:
-                instance.images.filter(is_main=True).update(is_main=False)
-
-            ListingImage.objects.create(listing=instance, image=file, is_main=is_main)
-
-    # Refresh instance to properly delete the last listing image
-    instance.refresh_from_db()
+    # Handle new images, their ids are known before they are inserted
+    images, new_main = _manifest_images(
+        instance, files, request_data.get("manifest", "[]")
+    )
+    if new_main:
+        main_id = new_main.id
 
     # Set main image, if the main image isnt new
     main_image_id = request_data.get("main_image_id")
     if main_image_id:
-        instance.images.filter(is_main=True).update(is_main=False)
-        instance.images.filter(id=main_image_id).update(is_main=True)
+        main_id = (
+            instance.images.filter(id=main_image_id)
+            .values_list("id", flat=True)
+            .first()
+            or main_id
+        )
 
     # Set main image, if it doesnt exist
-    if not instance.images.filter(is_main=True):
-        image = instance.images.first()
-        if image:
-            image.is_main = True
-            image.save()
+    if main_id is None:
+        main_id = instance.images.values_list("id", flat=True).order_by("id").first()
+    if main_id is None and images:
+        main_id = images[0].id
+
+    # Only one image can be flagged, so clear the old flag before setting the new one
+    instance.images.filter(is_main=True).exclude(id=main_id).update(is_main=False)
+    for image in images:
+        image.is_main = image.id == main_id
+    ListingImage.objects.bulk_create(images)
+    if main_id is not None and main_id not in [image.id for image in images]:
+        instance.images.filter(id=main_id, is_main=False).update(is_main=True)
+
+    instance.main_image_id = main_id
+    instance.save()
+    bump_listing_versions([instance.id])
 
     instance.refresh_from_db()
 
     return instance
 
 
+# Add images fetched for a listing, the first one is its main image if it has none
+@transaction.atomic
+def add_listing_images(listing_id, files):
+    listing = (
+        Listing.objects.select_for_update(of=("self",))
+        .select_related("seller")
+        .filter(id=listing_id)
+        .first()
+    )
+    if listing is None:
+        return
+
+    images = [ListingImage(listing=listing, image=file) for file in files]
+    if listing.main_image_id is None:
+        images[0].is_main = True
+        listing.main_image = images[0]
+
+    ListingImage.objects.bulk_create(images)
+    listing.save(update_fields=["main_image"])
+    bump_listing_versions([listing.id])
+
+
 def add_to_cart(user, listing, quantity):
     cart, _ = Cart.objects.get_or_create(user=user)
 
@@ -123,7 +189,7 @@ def cart_total_price(cart):
 def create_order(user, order_id):
     # Get cart items
     cart = get_object_or_404(Cart, user=user)
-    cart_items = cart.items.select_related("listing").all()
+    cart_items = cart.items.select_related("listing__seller").all()
 
     existing_order = Order.objects.filter(id=order_id, buyer=user).first()
 
@@ -135,29 +201,31 @@ def create_order(user, order_id):
     if not cart_items.exists():
         raise Exception("Cart empty.")
 
-    # Handle stock on Redis
     for item in cart_items:
-        if item.listing.seller == user:
+        if item.listing.seller_id == user.id:
             raise Exception("You cannot buy your own listing.")
 
-        key = f"reserved_stock:{item.listing.id}"
-
-        # Create cache for the listing
-        cache.add(key, 0, timeout=3600)
-
-        # Increment cache and get current available in stock
-        total_reserved = cache.incr(key, item.quantity)
-
-        # Check if the stock is sufficient
-        if total_reserved > item.listing.quantity:
-            cache.decr(key, item.quantity)
-            raise Exception("Insufficient stock")
-
-        if total_reserved >= item.listing.quantity:
-            item.listing.status = Listing.ListingStatus.OUT_OF_STOCK
-            item.listing.save(update_fields=["status"])
+    # Hold every cart line on the order reservation ledger at once
+    new_order_id = uuid7()
+    short_listing, reserved = reserve_stock(
+        new_order_id, [(item.listing, item.quantity) for item in cart_items]
+    )
+    if short_listing:
+        raise Exception(f"Insufficient stock: {short_listing.title}")
 
     try:
+        # Flag fully reserved listings
+        sold_out = [
+            item.listing.id
+            for item in cart_items
+            if reserved[item.listing.id] >= item.listing.quantity
+        ]
+        if sold_out:
+            Listing.objects.filter(id__in=sold_out).update(
+                status=Listing.ListingStatus.OUT_OF_STOCK
+            )
+            bump_listing_versions(sold_out)
+
         # Get total price
         cart_price = cart.items.aggregate(
             total=Sum(F("quantity") * F("listing__price"))
@@ -166,6 +234,7 @@ def create_order(user, order_id):
 
         # Create order
         order = Order.objects.create(
+            id=new_order_id,
             buyer=user,
             total_price=total_price,
             buyer_address=user.location,
@@ -190,6 +259,16 @@ def create_order(user, order_id):
             ]
         )
 
+        OrderParticipant.objects.bulk_create(
+            [OrderParticipant(order=order, user=user, role=OrderParticipant.Role.BUYER)]
+            + [
+                OrderParticipant(
+                    order=order, user_id=seller_id, role=OrderParticipant.Role.SELLER
+                )
+                for seller_id in {item.listing.seller_id for item in cart_items}
+            ]
+        )
+
         # Create stripe payment intent
         client_secret = create_payment_intent(user, order)
 
@@ -197,43 +276,52 @@ def create_order(user, order_id):
         cart_items.all().delete()
 
         return order, client_secret
-    except Exception as e:
-        for item in cart_items:
-            cache.decr(f"reserved_stock:{item.listing.id}", item.quantity)
-            if item.listing.available_stock > 0:
-                item.listing.status = Listing.ListingStatus.IN_STOCK
-        raise e
+    except Exception:
+        # Listing statuses are rolled back with the transaction
+        release_stock(new_order_id)
+        raise
+
+
+def payment_intent_status(intent_id):
+    # Polling a pending order reads the intent from Redis, one request refreshes it
+    return single_flight(
+        "payment_intent",
+        f"payment_intent:{intent_id}",
+        lambda: payment_gateway().retrieve_intent(intent_id),
+        timeout=PAYMENT_INTENT_TIMEOUT,
+    )
 
 
 def create_payment_intent(user, order):
     # Check if the order already have a intent
     if order.intent_id:
         try:
-            intent = stripe.PaymentIntent.retrieve(order.intent_id)
+            intent = payment_intent_status(order.intent_id)
 
             # Reuse the existing one if possible
             if (
-                intent.amount == int(order.total_price * 100)
-                and intent.status == "requires_payment_method"
+                intent["amount"] == int(order.total_price * 100)
+                and intent["status"] == "requires_payment_method"
             ):
-                return intent.client_secret
-        except stripe.error.StripeError:
+                return intent["client_secret"]
+        except PaymentError:
             pass
 
     # If no intent available, create a new one
+    # Retries replacing the same intent reach Stripe with the same key
     try:
-        intent = stripe.PaymentIntent.create(
+        intent = payment_gateway().create_intent(
             amount=int(order.total_price * 100),
-            currency="usd",
             metadata={"order_id": order.id, "user_id": user.id},
+            idempotency_key=f"order:{order.id}:intent:{order.intent_id or 'new'}",
         )
     except Exception as e:
         raise Exception(f"Stripe integration error: {str(e)}")
 
-    order.intent_id = intent.id
+    order.intent_id = intent["id"]
     order.save(update_fields=["intent_id"])
 
-    return intent.client_secret
+    return intent["client_secret"]
 
 
 @transaction.atomic
@@ -242,34 +330,141 @@ def order_success(order_id):
     if order.status != Order.PaymentStatus.PENDING:
         return
 
-    for item in order.items.all():
-        listing = item.listing
-        if not listing:
-            continue
+    items = order.items.filter(listing__isnull=False)
+
+    # Quantity sold per listing
+    rows = sales_rows(items)
+    sold = {}
+    for row in rows:
+        sold[row["listing_id"]] = sold.get(row["listing_id"], 0) + row["quantity"]
+
+    if sold:
+        # Lock the listings in a stable order so concurrent orders can't deadlock
+        listings = list(
+            Listing.objects.select_for_update()
+            .filter(id__in=sold)
+            .order_by("id")
+            .only("id", "quantity")
+        )
 
-        Listing.objects.filter(id=listing.id).update(
-            quantity=F("quantity") - item.quantity
+        # A payment landing after the deadline finds its stock released, it takes
+        # it again while it's free, otherwise the order is refused and refunded
+        short_listing, _ = reserve_stock(
+            order.id, [(listing, sold[listing.id]) for listing in listings]
+        )
+        if short_listing:
+            refuse_payment(order)
+            return
+
+        # Release the order reservation ledger
+        reserved = release_stock(order.id)
+        reserved.update(
+            reserved_stock(
+                [listing_id for listing_id in sold if listing_id not in reserved]
+            )
         )
-        listing.refresh_from_db()
 
-        key = f"reserved_stock:{listing.id}"
-        reserved = cache.decr(key, item.quantity)
-        if reserved < 0:
-            cache.set(key, 0, timeout=3600)
+        # Decrement the listings and set their status from the stock left at once
+        lines = [
+            (listing_id, sold[listing_id], reserved[listing_id]) for listing_id in sold
+        ]
+        values = ", ".join(["(%s::uuid, %s::integer, %s::integer)"] * len(lines))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Listing._meta.db_table} AS listing
+                SET quantity = listing.quantity - line.sold,
+                    status = CASE
+                        WHEN listing.quantity - line.sold - line.reserved <= 0 THEN %s
+                        ELSE %s
+                    END
+                FROM (VALUES {values}) AS line (id, sold, reserved)
+                WHERE listing.id = line.id
+                """,
+                [
+                    Listing.ListingStatus.OUT_OF_STOCK,
+                    Listing.ListingStatus.IN_STOCK,
+                    *[value for line in lines for value in line],
+                ],
+            )
 
-        # Update listing status based on Redis stock
-        if listing.available_stock <= 0:
-            listing.status = Listing.ListingStatus.OUT_OF_STOCK
-        else:
-            listing.status = Listing.ListingStatus.IN_STOCK
+        roll_up_items(rows, OrderItem.ShippingStatus.AWAITING_SHIPMENT)
+        items.update(status=OrderItem.ShippingStatus.AWAITING_SHIPMENT)
+        bump_listing_versions(sold)
 
-        listing.save(update_fields=["status"])
+    order.status = Order.PaymentStatus.PAID
+    order.save(update_fields=["status"])
+    forget_payment_intent(order)
 
-        item.status = OrderItem.ShippingStatus.AWAITING_SHIPMENT
-        item.save(update_fields=["status"])
 
-    order.status = Order.PaymentStatus.PAID
+# Refund the payment of an order whose stock is gone and cancel the order
+def refuse_payment(order):
+    try:
+        payment_gateway().refund_intent(order.intent_id)
+    except PaymentError as error:
+        raise Exception(f"Refund failed: {str(error)}")
+
+    order.items.update(status=OrderItem.ShippingStatus.CANCELLED)
+    order.status = Order.PaymentStatus.CANCELLED
     order.save(update_fields=["status"])
+    forget_payment_intent(order)
+
+
+def forget_payment_intent(order):
+    # The cached status of the intent would still hand out its client secret
+    if order.intent_id:
+        key = f"payment_intent:{order.intent_id}"
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+# Cancel pending orders past their reservation, the caller holds their row locks
+def cancel_expired_orders(order_ids):
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    listing_ids = set(
+        items.filter(listing__isnull=False).values_list("listing_id", flat=True)
+    )
+
+    # Release every ledger at once, with the orders locked so none is being paid
+    reserved = release_orders_stock(order_ids)
+    reserved.update(
+        reserved_stock(
+            [listing_id for listing_id in listing_ids if listing_id not in reserved]
+        )
+    )
+
+    if listing_ids:
+        # Lock the listings in a stable order so concurrent orders can't deadlock
+        list(
+            Listing.objects.select_for_update()
+            .filter(id__in=listing_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+        # Put back in stock the sold out listings the orders were holding
+        lines = [(listing_id, reserved[listing_id]) for listing_id in listing_ids]
+        values = ", ".join(["(%s::uuid, %s::integer)"] * len(lines))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Listing._meta.db_table} AS listing
+                SET status = %s
+                FROM (VALUES {values}) AS line (id, reserved)
+                WHERE listing.id = line.id
+                    AND listing.status = %s
+                    AND listing.quantity - line.reserved > 0
+                RETURNING listing.id
+                """,
+                [
+                    Listing.ListingStatus.IN_STOCK,
+                    *[value for line in lines for value in line],
+                    Listing.ListingStatus.OUT_OF_STOCK,
+                ],
+            )
+            bump_listing_versions(row[0] for row in cursor.fetchall())
+
+    items.update(status=OrderItem.ShippingStatus.CANCELLED)
+    Order.objects.filter(id__in=order_ids).update(status=Order.PaymentStatus.CANCELLED)
 
 
 @transaction.atomic
@@ -281,18 +476,17 @@ def cancel_order(order, user):
         raise Exception("Order is not refundable")
 
     try:
-        intent = stripe.PaymentIntent.retrieve(order.intent_id)
+        payment_gateway().refund_intent(order.intent_id)
+    except PaymentError as error:
+        raise Exception(f"Refund failed: {str(error)}")
 
-        if intent.status == "succeeded":
-            stripe.Refund.create(payment_intent=order.intent_id)
+    rows = sales_rows(order.items.select_for_update())
+    roll_up_items(rows, OrderItem.ShippingStatus.CANCELLED)
 
-        elif intent.status in ["requires_payment_method", "requires_confirmation"]:
-            stripe.PaymentIntent.cancel(order.intent_id)
-    except stripe.error.StripeError as error:
-        if "already been refunded" not in str(error).lower():
-            raise Exception(f"Refund failed: {str(error)}")
+    items = list(order.items.select_related("listing"))
+    reserved = reserved_stock([item.listing.id for item in items if item.listing])
 
-    for item in order.items.all():
+    for item in items:
         listing = item.listing
         if listing:
             Listing.objects.filter(id=listing.id).update(
@@ -300,13 +494,217 @@ def cancel_order(order, user):
             )
             listing.refresh_from_db()
 
-            if listing.status == Listing.ListingStatus.OUT_OF_STOCK:
+            if (
+                listing.status == Listing.ListingStatus.OUT_OF_STOCK
+                and listing.quantity - reserved[listing.id] > 0
+            ):
                 listing.status = Listing.ListingStatus.IN_STOCK
                 listing.save(update_fields=["status"])
 
         item.status = OrderItem.ShippingStatus.CANCELLED
         item.save(update_fields=["status"])
 
+    bump_listing_versions([item.listing.id for item in items if item.listing])
+
     order.status = Order.PaymentStatus.CANCELLED
     order.save(update_fields=["status"])
     return order
+
+
+@transaction.atomic
+def mark_items_shipped(order, item_ids, tracking_code):
+    items = order.items.select_for_update().filter(
+        id__in=item_ids, status=OrderItem.ShippingStatus.AWAITING_SHIPMENT
+    )
+    rows = sales_rows(items)
+
+    roll_up_items(rows, OrderItem.ShippingStatus.IN_TRANSIT)
+    items.update(
+        tracking_code=tracking_code, status=OrderItem.ShippingStatus.IN_TRANSIT
+    )
+
+
+# Ship items of a seller across orders in one statement, lines are
+# (item id, tracking code) pairs. Returns the error of each item not shipped.
+@transaction.atomic
+def ship_items(seller, lines):
+    values = ", ".join(["(%s::bigint, %s)"] * len(lines))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {OrderItem._meta.db_table} AS item
+            SET status = %s, tracking_code = line.tracking_code
+            FROM (VALUES {values}) AS line (id, tracking_code),
+                {Order._meta.db_table} AS orders
+            WHERE item.id = line.id
+                AND orders.id = item.order_id
+                AND item.seller_id = %s
+                AND item.status = %s
+            RETURNING item.id, item.order_id, orders.created_at, item.quantity,
+                item.snapshot_listing_price
+            """,
+            [
+                OrderItem.ShippingStatus.IN_TRANSIT,
+                *[value for line in lines for value in line],
+                seller.id,
+                OrderItem.ShippingStatus.AWAITING_SHIPMENT,
+            ],
+        )
+        shipped = cursor.fetchall()
+
+    roll_up_items(
+        [
+            {
+                "seller_id": seller.id,
+                "order_id": order_id,
+                "order__created_at": created_at,
+                "quantity": quantity,
+                "snapshot_listing_price": price,
+                "status": OrderItem.ShippingStatus.AWAITING_SHIPMENT,
+            }
+            for _, order_id, created_at, quantity, price in shipped
+        ],
+        OrderItem.ShippingStatus.IN_TRANSIT,
+    )
+
+    # Tell items of another seller apart from items in the wrong status
+    shipped_ids = {row[0] for row in shipped}
+    failed = [item_id for item_id, _ in lines if item_id not in shipped_ids]
+    owned = set()
+    if failed:
+        owned = set(
+            OrderItem.objects.filter(id__in=failed, seller=seller).values_list(
+                "id", flat=True
+            )
+        )
+
+    errors = {}
+    for item_id in failed:
+        if item_id in owned:
+            errors[item_id] = "Item is not awaiting shipment."
+        else:
+            errors[item_id] = "Item not found."
+    return errors
+
+
+# Stripe events handled, each one acts on the order in its metadata
+STRIPE_EVENT_HANDLERS = {
+    "payment_intent.succeeded": order_success,
+}
+
+
+# Store a verified Stripe event once, returns (event, created)
+# Retries of an already stored event are not processed again
+def record_stripe_event(event, payload):
+    order_id = None
+    error = None
+    if event["type"] in STRIPE_EVENT_HANDLERS:
+        order_id = (event["data"]["object"].get("metadata") or {}).get("order_id")
+
+    # Metadata that isn't an order id is stored and ignored, failing the request
+    # would only have Stripe retry it
+    if order_id:
+        try:
+            order_id = uuid.UUID(str(order_id))
+        except ValueError:
+            error = f"Malformed order id {order_id!r} in metadata."
+            order_id = None
+
+    return StripeEvent.objects.get_or_create(
+        id=event["id"],
+        defaults={
+            "type": event["type"],
+            "order_id": order_id,
+            "payload": payload,
+            "created": datetime.fromtimestamp(event["created"], tz=dt_timezone.utc),
+            "status": (
+                StripeEvent.EventStatus.PENDING
+                if order_id
+                else StripeEvent.EventStatus.IGNORED
+            ),
+            "error": error,
+        },
+    )
+
+
+# Run the pending and failed events of an order in the order Stripe created them
+# Stops at the first failure so a later event never runs before an earlier one
+def process_stripe_events(order_id):
+    events = StripeEvent.objects.filter(
+        order_id=order_id,
+        status__in=[StripeEvent.EventStatus.PENDING, StripeEvent.EventStatus.FAILED],
+    )
+
+    processed = 0
+    for event in list(events):
+        try:
+            with transaction.atomic():
+                # Concurrent consumers of the order wait for each other here
+                event = StripeEvent.objects.select_for_update().get(id=event.id)
+                if event.status not in [
+                    StripeEvent.EventStatus.PENDING,
+                    StripeEvent.EventStatus.FAILED,
+                ]:
+                    continue
+
+                STRIPE_EVENT_HANDLERS[event.type](event.order_id)
+
+                event.status = StripeEvent.EventStatus.PROCESSED
+                event.attempts += 1
+                event.error = None
+                event.processed_at = timezone.now()
+                event.save(
+                    update_fields=["status", "attempts", "error", "processed_at"]
+                )
+                processed += 1
+        except Exception as e:
+            StripeEvent.objects.filter(id=event.id).update(
+                status=StripeEvent.EventStatus.FAILED,
+                attempts=F("attempts") + 1,
+                error=str(e),
+            )
+            raise
+
+    return processed
+
+
+# Queue stored events to run again, returns the orders to process
+def replay_stripe_events(events):
+    events = events.exclude(order_id=None)
+    order_ids = set(events.values_list("order_id", flat=True))
+    events.update(status=StripeEvent.EventStatus.PENDING, error=None)
+    return order_ids
+
+
+# Delete listings with their images, returns (rows deleted, image files)
+# File names are blanked first so the delete doesn't remove each file inline,
+# the caller queues the returned files for removal instead
+@transaction.atomic
+def purge_listings(listing_ids):
+    images = ListingImage.objects.filter(listing_id__in=listing_ids)
+    files = list(images.exclude(image="").values_list("image", flat=True))
+    images.update(image="")
+
+    deleted, _ = Listing.objects.filter(id__in=listing_ids).delete()
+
+    transaction.on_commit(
+        lambda: cache.delete_many(
+            [f"listing_detail:{listing_id}" for listing_id in listing_ids]
+        )
+    )
+    return deleted, files
+
+
+# Delete users without listings left, returns (rows deleted, profile picture files)
+@transaction.atomic
+def purge_users(user_ids):
+    users = User.objects.filter(id__in=user_ids)
+    files = list(
+        users.exclude(profile_picture=None)
+        .exclude(profile_picture="")
+        .values_list("profile_picture", flat=True)
+    )
+    users.update(profile_picture=None)
+
+    deleted, _ = users.delete()
+    return deleted, files
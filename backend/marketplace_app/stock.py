@@ -0,0 +1,402 @@
+import uuid
+from datetime import timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+# Time a pending order holds its stock
+RESERVATION_TIMEOUT = timedelta(minutes=15)
+
+# Expired ledgers released per reservation
+RELEASE_BATCH = 100
+
+# reserved_stock:<listing_id> -> live sum of every hold on the listing
+# reservation:<order_id>      -> hash {listing_id: quantity} held by the order
+# reservation_deadlines       -> sorted set of order ids scored by expiration
+# Reserving and reconciling first release the ledgers past their deadline, so
+# expired orders never keep stock from a buyer. Every key a script touches is in
+# KEYS, the ledgers of expired orders are read before the script runs.
+LEDGER_FUNCTIONS = """
+-- Release the ledgers found past their deadline, or return false without touching
+-- anything when one of them or one of their listings wasn't passed
+-- ledgers maps order ids to ledger keys, stock_keys listing ids to stock keys
+local function release_expired(deadlines, now, limit, ledgers, stock_keys)
+    local expired = redis.call(
+        "ZRANGEBYSCORE", deadlines, "-inf", now, "LIMIT", 0, limit
+    )
+
+    local held = {}
+    for i, order_id in ipairs(expired) do
+        if not ledgers[order_id] then
+            return false
+        end
+        held[i] = redis.call("HGETALL", ledgers[order_id])
+        for j = 1, #held[i], 2 do
+            if not stock_keys[held[i][j]] then
+                return false
+            end
+        end
+    end
+
+    for i, order_id in ipairs(expired) do
+        local lines = held[i]
+        for j = 1, #lines, 2 do
+            local key = stock_keys[lines[j]]
+            if redis.call("DECRBY", key, tonumber(lines[j + 1])) < 0 then
+                redis.call("SET", key, 0)
+            end
+        end
+        redis.call("DEL", ledgers[order_id])
+        redis.call("ZREM", deadlines, order_id)
+    end
+    return true
+end
+"""
+
+# Hold every line or none of them, returns {1, reserved...}, {0, short_index}, or
+# {-1} when an expired ledger changed since its keys were read
+# KEYS: deadlines, ledger, stock keys of the lines, expired ledgers, other stock keys
+# ARGV: order id, deadline, enforce, now, lines, expired orders, then listing id,
+# quantity, stock per line, the expired order ids and the other listing ids
+RESERVE_SCRIPT = LEDGER_FUNCTIONS + """
+local deadlines = KEYS[1]
+local ledger = KEYS[2]
+local enforce = ARGV[3] == "1"
+local lines = tonumber(ARGV[5])
+local orders = tonumber(ARGV[6])
+local reserved = {1}
+
+local ledgers = {[ARGV[1]] = ledger}
+local stock_keys = {}
+for i = 1, lines do
+    stock_keys[ARGV[4 + i * 3]] = KEYS[2 + i]
+end
+for i = 1, orders do
+    ledgers[ARGV[6 + lines * 3 + i]] = KEYS[2 + lines + i]
+end
+for i = 7 + lines * 3 + orders, #ARGV do
+    stock_keys[ARGV[i]] = KEYS[i - 4 - lines * 2]
+end
+
+if not release_expired(deadlines, ARGV[4], orders, ledgers, stock_keys) then
+    return {-1}
+end
+
+-- The order already holds its stock
+if redis.call("EXISTS", ledger) == 1 then
+    for i = 3, lines + 2 do
+        table.insert(reserved, tonumber(redis.call("GET", KEYS[i]) or "0"))
+    end
+    return reserved
+end
+
+for i = 3, lines + 2 do
+    local line = 7 + (i - 3) * 3
+    local total = tonumber(redis.call("GET", KEYS[i]) or "0") + tonumber(ARGV[line + 1])
+
+    if enforce and total > tonumber(ARGV[line + 2]) then
+        return {0, i - 2}
+    end
+    table.insert(reserved, total)
+end
+
+for i = 3, lines + 2 do
+    local line = 7 + (i - 3) * 3
+    redis.call("INCRBY", KEYS[i], tonumber(ARGV[line + 1]))
+    redis.call("HSET", ledger, ARGV[line], ARGV[line + 1])
+end
+
+redis.call("ZADD", deadlines, tonumber(ARGV[2]), ARGV[1])
+
+return reserved
+"""
+
+# Release the ledgers of orders, returns {1, listing_id, reserved, ...}, or {0}
+# without touching anything when a ledger holds a listing whose key wasn't passed
+# KEYS: deadlines, ledgers, stock keys
+# ARGV: number of orders, order ids, listing ids of the stock keys
+RELEASE_SCRIPT = """
+local orders = tonumber(ARGV[1])
+local stock_keys = {}
+for i = 2 + orders, #ARGV do
+    stock_keys[ARGV[i]] = KEYS[i]
+end
+
+local ledgers = {}
+for i = 2, orders + 1 do
+    local lines = redis.call("HGETALL", KEYS[i])
+    for j = 1, #lines, 2 do
+        if not stock_keys[lines[j]] then
+            return {0}
+        end
+    end
+    ledgers[i] = lines
+end
+
+local reserved = {1}
+for i = 2, orders + 1 do
+    local lines = ledgers[i]
+    for j = 1, #lines, 2 do
+        local key = stock_keys[lines[j]]
+        local left = redis.call("DECRBY", key, tonumber(lines[j + 1]))
+        if left < 0 then
+            redis.call("SET", key, 0)
+            left = 0
+        end
+        table.insert(reserved, lines[j])
+        table.insert(reserved, left)
+    end
+
+    redis.call("DEL", KEYS[i])
+    redis.call("ZREM", KEYS[1], ARGV[i])
+end
+return reserved
+"""
+
+# Release the expired ledgers and rebuild drifted counters from the others,
+# returns {1, fixed listing ids...}, or {0} when orders or listings changed since
+# their keys were read
+# KEYS as RELEASE_SCRIPT
+# ARGV: now, then as RELEASE_SCRIPT
+RECONCILE_SCRIPT = LEDGER_FUNCTIONS + """
+local orders = tonumber(ARGV[2])
+local ledgers = {}
+local stock_keys = {}
+for i = 3 + orders, #ARGV do
+    stock_keys[ARGV[i]] = KEYS[i - 1]
+end
+
+if redis.call("ZCARD", KEYS[1]) ~= orders then
+    return {0}
+end
+
+for i = 2, orders + 1 do
+    if not redis.call("ZSCORE", KEYS[1], ARGV[i + 1]) then
+        return {0}
+    end
+
+    local lines = redis.call("HGETALL", KEYS[i])
+    for j = 1, #lines, 2 do
+        if not stock_keys[lines[j]] then
+            return {0}
+        end
+    end
+    ledgers[ARGV[i + 1]] = KEYS[i]
+end
+
+release_expired(KEYS[1], ARGV[1], orders, ledgers, stock_keys)
+
+local expected = {}
+for listing_id in pairs(stock_keys) do
+    expected[listing_id] = 0
+end
+
+for i = 2, orders + 1 do
+    local lines = redis.call("HGETALL", KEYS[i])
+    for j = 1, #lines, 2 do
+        expected[lines[j]] = expected[lines[j]] + tonumber(lines[j + 1])
+    end
+end
+
+local fixed = {1}
+for listing_id, total in pairs(expected) do
+    local key = stock_keys[listing_id]
+    local current = tonumber(redis.call("GET", key) or "0")
+
+    if current ~= total then
+        table.insert(fixed, listing_id)
+    end
+
+    if total == 0 then
+        redis.call("DEL", key)
+    elseif current ~= total then
+        redis.call("SET", key, total)
+    end
+end
+
+return fixed
+"""
+
+# Attempts of a script whose keys changed between reading and running it
+SCRIPT_ATTEMPTS = 5
+
+
+def stock_key(listing_id):
+    return cache.make_key(f"reserved_stock:{listing_id}")
+
+
+def ledger_key(order_id):
+    return cache.make_key(f"reservation:{order_id}")
+
+
+def _deadlines_key():
+    return cache.make_key("reservation_deadlines")
+
+
+def _run(script, keys, args):
+    return get_redis_connection("default").register_script(script)(keys=keys, args=args)
+
+
+def _timestamp(value):
+    return int(value.timestamp())
+
+
+def _merge_lines(lines):
+    # Group quantities by listing, keeping the first seen listing instance
+    merged = {}
+    for listing, quantity in lines:
+        if listing.id in merged:
+            merged[listing.id] = (listing, merged[listing.id][1] + quantity)
+        else:
+            merged[listing.id] = (listing, quantity)
+    return list(merged.values())
+
+
+# Listing ids held by the ledgers of orders, read in one round trip
+def _ledger_listings(order_ids):
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for order_id in order_ids:
+        pipeline.hkeys(ledger_key(order_id))
+    return {listing_id.decode() for keys in pipeline.execute() for listing_id in keys}
+
+
+# Run a script over orders and the listings their ledgers hold, returns None when
+# a ledger changed between reading its listings and running the script
+# args go before the orders in ARGV
+def _run_over_ledgers(script, order_ids, listing_ids=(), args=()):
+    order_ids = list(dict.fromkeys(str(order_id) for order_id in order_ids))
+    listings = sorted(_ledger_listings(order_ids) | set(listing_ids))
+    keys = [
+        _deadlines_key(),
+        *[ledger_key(order_id) for order_id in order_ids],
+        *[stock_key(listing_id) for listing_id in listings],
+    ]
+    result = _run(script, keys, [*args, len(order_ids), *order_ids, *listings])
+    return result[1:] if result[0] else None
+
+
+# Order ids past their deadline, as many as a reservation releases
+def _expired_orders(now):
+    return [
+        order_id.decode()
+        for order_id in get_redis_connection("default").zrangebyscore(
+            _deadlines_key(), "-inf", _timestamp(now), start=0, num=RELEASE_BATCH
+        )
+    ]
+
+
+def _until_unchanged(run):
+    for _ in range(SCRIPT_ATTEMPTS):
+        result = run()
+        if result is not None:
+            return result
+    raise Exception("Reservation ledgers kept changing, try again")
+
+
+# Hold (listing, quantity) lines for an order in a single atomic round trip,
+# releasing the expired ledgers first
+# Returns (None, {listing_id: reserved}), or (short_listing, None) reserving nothing
+def reserve_stock(order_id, lines, expires_at=None, enforce=True):
+    lines = _merge_lines(lines)
+    if not lines:
+        return None, {}
+
+    now = timezone.now()
+    expires_at = expires_at or now + RESERVATION_TIMEOUT
+    result = _until_unchanged(
+        lambda: _reserve(order_id, lines, now, expires_at, enforce)
+    )
+
+    if not result[0]:
+        return lines[result[1] - 1][0], None
+
+    return None, {
+        listing.id: int(reserved) for (listing, _), reserved in zip(lines, result[1:])
+    }
+
+
+# Run RESERVE_SCRIPT with the keys of the expired ledgers, returns None when one
+# of them changed in between
+def _reserve(order_id, lines, now, expires_at, enforce):
+    expired = _expired_orders(now)
+    line_listings = {str(listing.id) for listing, _ in lines}
+    others = sorted(_ledger_listings(expired) - line_listings)
+
+    args = [
+        str(order_id),
+        _timestamp(expires_at),
+        1 if enforce else 0,
+        _timestamp(now),
+        len(lines),
+        len(expired),
+    ]
+    for listing, quantity in lines:
+        args += [str(listing.id), quantity, listing.quantity]
+    args += [*expired, *others]
+
+    keys = [
+        _deadlines_key(),
+        ledger_key(order_id),
+        *[stock_key(listing.id) for listing, _ in lines],
+        *[ledger_key(expired_id) for expired_id in expired],
+        *[stock_key(listing_id) for listing_id in others],
+    ]
+    result = _run(RESERVE_SCRIPT, keys, args)
+    return None if result[0] == -1 else result
+
+
+# Release everything held by an order, safe to call more than once
+# Returns {listing_id: reserved} with what is left reserved
+def release_stock(order_id):
+    return release_orders_stock([order_id])
+
+
+# Release everything held by several orders in a single round trip
+# Returns {listing_id: reserved} with what is left reserved
+def release_orders_stock(order_ids):
+    if not order_ids:
+        return {}
+
+    result = _until_unchanged(lambda: _run_over_ledgers(RELEASE_SCRIPT, order_ids))
+    return {
+        uuid.UUID(result[i].decode()): int(result[i + 1])
+        for i in range(0, len(result), 2)
+    }
+
+
+# Order ids currently holding stock
+def held_orders():
+    client = get_redis_connection("default")
+    return [
+        uuid.UUID(order_id.decode())
+        for order_id in client.zrange(_deadlines_key(), 0, -1)
+    ]
+
+
+# Release the expired ledgers and fix counters that drifted from the others,
+# returns the fixed listing ids
+def reconcile_stock():
+    listing_ids = [key.split(":", 1)[1] for key in cache.iter_keys("reserved_stock:*")]
+    now = _timestamp(timezone.now())
+    result = _until_unchanged(
+        lambda: _run_over_ledgers(
+            RECONCILE_SCRIPT, held_orders(), listing_ids, args=[now]
+        )
+    )
+    return [uuid.UUID(listing_id.decode()) for listing_id in result]
+
+
+# Reserved quantity of several listings with a single MGET
+def reserved_stock(listing_ids):
+    listing_ids = list(dict.fromkeys(listing_ids))
+    if not listing_ids:
+        return {}
+
+    values = get_redis_connection("default").mget(
+        [stock_key(listing_id) for listing_id in listing_ids]
+    )
+
+    return {
+        listing_id: int(value) if value is not None else 0
+        for listing_id, value in zip(listing_ids, values)
+    }
@@ -1,83 +1,404 @@
-from datetime import timedelta
+import ipaddress
+import os
+import requests
+import socket
+import time
+from datetime import date, timedelta
+from urllib.parse import urljoin, urlparse
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.core.cache import cache, caches
 from django.utils import timezone
-from django.db.models import Sum
 from celery import shared_task
-from .models import Order, Listing, User, OrderItem
+from .analytics import rebuild_seller_sales, sales_day
+from .models import Order, Listing, ListingImportJob, User, StripeEvent
+from .stock import (
+    RESERVATION_TIMEOUT,
+    reserve_stock,
+    release_orders_stock,
+    held_orders,
+    reconcile_stock,
+)
+from .services import (
+    process_stripe_events,
+    cancel_expired_orders,
+    purge_listings,
+    purge_users,
+    add_listing_images,
+)
+from .utils import validate_image
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Expired orders cancelled per transaction
+EXPIRED_ORDERS_BATCH = 500
+
+# Inactive rows purged per transaction, with a pause between transactions so the
+# purge doesn't hold locks requests wait on
+INACTIVE_BATCH = 200
+INACTIVE_BATCH_PAUSE = 0.1
+
+# Progress of the running purge, an interrupted one resumes from it
+INACTIVE_CHECKPOINT = "clean_inactive:checkpoint"
+INACTIVE_CHECKPOINT_TIMEOUT = 24 * 60 * 60
+
+# Imported listing images are downloaded with these timeouts, and refused past the
+# upload size limit of validate_image
+IMAGE_FETCH_TIMEOUT = (3, 10)
+IMAGE_FETCH_MAX_SIZE = 5 * 1024 * 1024
+
+# Redirects followed per image url, every hop is checked like the url itself
+IMAGE_FETCH_MAX_REDIRECTS = 3
+
+# Days of seller sales rebuilt per backfill run, each run queues the next one
+SALES_BACKFILL_DAYS = 7
+
 
 @shared_task
 def sync_redis_stock():
-    pending_items = (
-        OrderItem.objects.filter(order__status=Order.PaymentStatus.PENDING)
-        .values("listing_id")
-        .annotate(total_reserved=Sum("quantity"))
+    held = set(held_orders())
+
+    # Release ledgers of orders already paid or cancelled
+    settled = Order.objects.filter(id__in=held).exclude(
+        status=Order.PaymentStatus.PENDING
     )
+    release_orders_stock(list(settled.values_list("id", flat=True)))
+
+    # Restore ledgers of pending orders lost by Redis, expired ones hold nothing.
+    # Orders being paid or cancelled are locked and left to them, their ledger may
+    # be released already.
+    with transaction.atomic():
+        pending = (
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(
+                status=Order.PaymentStatus.PENDING,
+                created_at__gt=timezone.now() - RESERVATION_TIMEOUT,
+            )
+            .exclude(id__in=held)
+            .prefetch_related("items__listing")
+        )
+        for order in pending:
+            lines = [
+                (item.listing, item.quantity)
+                for item in order.items.all()
+                if item.listing
+            ]
+            reserve_stock(
+                order.id,
+                lines,
+                expires_at=order.created_at + RESERVATION_TIMEOUT,
+                enforce=False,
+            )
 
-    for item in pending_items:
-        key = f"reserved_stock:{item['listing_id']}"
-        cache.set(key, item["total_reserved"], timeout=3600)
+    fixed = reconcile_stock()
+    if fixed:
+        logger.info(f"Reserved stock reconciled for {len(fixed)} listings")
 
 
 @shared_task
 def clean_inactive():
-    time_limit = timezone.now() - timedelta(days=30)
+    # Resume an interrupted run after its last committed batch
+    checkpoint = cache.get(INACTIVE_CHECKPOINT) or {
+        "time_limit": timezone.now() - timedelta(days=30),
+        "phase": "listings",
+        "after": None,
+    }
+    time_limit = checkpoint["time_limit"]
+
+    phases = {
+        "listings": (
+            Listing.objects.filter(is_active=False, inactive_date__lte=time_limit),
+            purge_listings,
+        ),
+        "users": (
+            User.objects.filter(is_active=False, inactive_date__lte=time_limit),
+            purge_users_with_listings,
+        ),
+    }
+    names = list(phases)
+
+    for phase in names[names.index(checkpoint["phase"]) :]:
+        if phase != checkpoint["phase"]:
+            checkpoint.update(phase=phase, after=None)
+
+        queryset, purge = phases[phase]
+        start = time.monotonic()
+        rows = purge_in_batches(queryset, purge, checkpoint)
+        elapsed = time.monotonic() - start
+        logger.info(
+            f"Purged {rows} rows of inactive {phase} in {elapsed:.1f}s "
+            f"({rows / max(elapsed, 0.001):.0f} rows/s)"
+        )
+
+    cache.delete(INACTIVE_CHECKPOINT)
+
+
+# Purge a batch of ids at a time, returns the rows deleted
+# The checkpoint, when given, is saved after every batch
+def purge_in_batches(queryset, purge, checkpoint=None):
+    rows = 0
+    after = checkpoint["after"] if checkpoint else None
+
+    while True:
+        batch = queryset.filter(id__gt=after) if after else queryset
+        ids = list(batch.order_by("id").values_list("id", flat=True)[:INACTIVE_BATCH])
+        if not ids:
+            return rows
 
-    inactive_users = User.objects.filter(
-        is_active=False, inactive_date__lte=time_limit
-    ).prefetch_related("listings")
+        deleted, files = purge(ids)
+        if files:
+            delete_stored_files.delay(files)
 
-    inactive_users.delete()
+        rows += deleted
+        after = ids[-1]
+        if checkpoint:
+            checkpoint["after"] = after
+            cache.set(INACTIVE_CHECKPOINT, checkpoint, INACTIVE_CHECKPOINT_TIMEOUT)
 
-    inactive_listings = Listing.objects.filter(
-        is_active=False, inactive_date__lte=time_limit
-    ).prefetch_related("images")
+        if len(ids) < INACTIVE_BATCH:
+            return rows
+        time.sleep(INACTIVE_BATCH_PAUSE)
 
-    inactive_listings.delete()
+
+# Listings of deleted accounts go with them, whatever their inactive date
+def purge_users_with_listings(user_ids):
+    rows = purge_in_batches(
+        Listing.objects.filter(seller_id__in=user_ids), purge_listings
+    )
+    deleted, files = purge_users(user_ids)
+    return rows + deleted, files
+
+
+@shared_task(bind=True, max_retries=3)
+def delete_stored_files(self, names):
+    failed = []
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.error(f"Could not delete {name}: {str(e)}")
+            failed.append(name)
+
+    if failed:
+        raise self.retry(args=[failed], countdown=60 * 2**self.request.retries)
 
 
 @shared_task
 def clean_expired_orders():
-    time_limit = timezone.now() - timedelta(minutes=15)
-    redis_cache = caches["default"]
-
+    time_limit = timezone.now() - RESERVATION_TIMEOUT
     expired_orders = Order.objects.filter(
         status=Order.PaymentStatus.PENDING, created_at__lt=time_limit
     )
 
-    for order in expired_orders:
+    cancelled = 0
+    while True:
         try:
             with transaction.atomic():
-                order = Order.objects.select_for_update().get(id=order.id)
+                # Orders locked by a payment or an overlapping run are left to it
+                order_ids = list(
+                    expired_orders.select_for_update(skip_locked=True)
+                    .order_by("id")
+                    .values_list("id", flat=True)[:EXPIRED_ORDERS_BATCH]
+                )
+                if order_ids:
+                    cancel_expired_orders(order_ids)
+        except Exception as e:
+            logger.error(f"Task error: {str(e)}")
+            break
 
-                if order.status == Order.PaymentStatus.PENDING:
-                    for item in order.items.all():
-                        listing = item.listing
-                        if not listing:
-                            continue
+        cancelled += len(order_ids)
+        if len(order_ids) < EXPIRED_ORDERS_BATCH:
+            break
 
-                        key = f"reserved_stock:{listing.id}"
-                        redis_val = redis_cache.get(key)
+    if cancelled:
+        logger.info(f"{cancelled} expired orders cancelled")
 
-                        if redis_val is not None:
-                            redis_cache.decr(key, item.quantity)
 
-                        if redis_cache.get(key) < 0:
-                            redis_cache.set(key, 0, timeout=3600)
+@shared_task(bind=True, max_retries=8)
+def consume_stripe_events(self, order_id):
+    try:
+        processed = process_stripe_events(order_id)
+    except Exception as e:
+        logger.error(f"Stripe events of order {order_id} failed: {str(e)}")
+        raise self.retry(exc=e, countdown=30 * 2**self.request.retries)
 
-                        if listing.status == Listing.ListingStatus.OUT_OF_STOCK:
-                            listing.status = Listing.ListingStatus.IN_STOCK
-                            listing.save()
+    if processed:
+        logger.info(f"{processed} Stripe events of order {order_id} processed")
 
-                        item.status = OrderItem.ShippingStatus.CANCELLED
-                        item.save()
 
-                    order.status = Order.PaymentStatus.CANCELLED
-                    order.save()
-                    logger.info(f"Order {order.id} cancelled")
-        except Exception as e:
-            logger.error(f"Task error: {str(e)}")
+@shared_task
+def process_pending_stripe_events():
+    # Picks up events whose consumer message was lost
+    order_ids = (
+        StripeEvent.objects.filter(
+            status=StripeEvent.EventStatus.PENDING,
+            received_at__lt=timezone.now() - timedelta(minutes=1),
+        )
+        .order_by("order_id")
+        .values_list("order_id", flat=True)
+        .distinct()
+    )
+
+    for order_id in order_ids:
+        consume_stripe_events.delay(str(order_id))
+
+
+# Rebuild the seller daily sales from start, an ISO date defaulting to the first
+# order, a chunk of days per run so no transaction spans the whole history
+@shared_task
+def backfill_seller_sales(start=None):
+    if start is None:
+        first = (
+            Order.objects.order_by("created_at")
+            .values_list("created_at", flat=True)
+            .first()
+        )
+        if first is None:
+            return
+        start = sales_day(first)
+    else:
+        start = date.fromisoformat(start)
+
+    end = start + timedelta(days=SALES_BACKFILL_DAYS)
+    rows = rebuild_seller_sales(start, end)
+    logger.info(f"Seller sales rebuilt from {start} to {end}, {rows} rows")
+
+    if end <= sales_day():
+        backfill_seller_sales.delay(end.isoformat())
+
+
+# Whether an address is on the public internet, not a private, loopback,
+# link-local, reserved or multicast one
+def is_public_address(address):
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+# Refuse urls that aren't http(s) or whose host resolves to an address that isn't
+# public, so imports can't reach the internal network or metadata endpoints.
+# Returns the parsed url and the address to connect to.
+def check_image_url(url):
+    parsed = urlparse(url)
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        raise ValidationError("Invalid port.")
+    if parsed.scheme not in ["http", "https"] or not parsed.hostname:
+        raise ValidationError("Only http and https urls are fetched.")
+
+    try:
+        addresses = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise requests.ConnectionError(str(e))
+
+    addresses = [
+        ipaddress.ip_address(sockaddr[0].split("%")[0])
+        for *_, sockaddr in addresses
+    ]
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise ValidationError(f"{parsed.hostname} is not a public address.")
+    return parsed, addresses[0]
+
+
+# Connects to the address an image url was checked against, whatever its host
+# resolves to by then, and checks the certificate against the host name
+class PinnedAddressAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, hostname, **kwargs):
+        self.hostname = hostname
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["server_hostname"] = self.hostname
+        kwargs["assert_hostname"] = self.hostname
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Body of an image url, redirects are followed by hand so each hop is checked.
+# Requests go to the checked address, never through proxies of the environment.
+def fetch_image(url):
+    for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+        parsed, address = check_image_url(url)
+        host = f"[{address}]" if address.version == 6 else str(address)
+        pinned = parsed._replace(netloc=f"{host}:{parsed.port or ''}".rstrip(":"))
+
+        with requests.Session() as session:
+            session.trust_env = False
+            session.mount(f"{parsed.scheme}://", PinnedAddressAdapter(parsed.hostname))
+            with session.get(
+                pinned.geturl(),
+                headers={"Host": parsed.netloc.rpartition("@")[2]},
+                timeout=IMAGE_FETCH_TIMEOUT,
+                stream=True,
+                allow_redirects=False,
+            ) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers["Location"])
+                    continue
+                response.raise_for_status()
+                return response.raw.read(IMAGE_FETCH_MAX_SIZE + 1, decode_content=True)
+
+    raise ValidationError("Too many redirects.")
+
+
+# Download the images of an imported listing, urls that can't be reached are retried
+@shared_task(bind=True, max_retries=3)
+def fetch_listing_images(self, listing_id, urls):
+    files, failed = [], []
+    for url in urls:
+        try:
+            content = fetch_image(url)
+            name = os.path.basename(urlparse(url).path)
+            file = ContentFile(content, name=name if "." in name else "image.jpg")
+            validate_image(file)
+        except requests.RequestException as e:
+            logger.error(f"Could not fetch {url}: {str(e)}")
+            failed.append(url)
+            continue
+        except ValidationError as e:
+            logger.error(f"Image {url} of listing {listing_id} refused: {e.messages[0]}")
+            continue
+        files.append(file)
+
+    if files:
+        add_listing_images(listing_id, files)
+
+    if failed:
+        raise self.retry(args=[listing_id, failed], countdown=60 * 2**self.request.retries)
+
+
+# Import an uploaded listing file, a job already claimed by a worker isn't run again
+@shared_task
+def import_listing_file(job_id):
+    # imports queues fetch_listing_images, so it's loaded once this module is
+    from .imports import import_listings, read_rows
+
+    claimed = ListingImportJob.objects.filter(
+        id=job_id, status=ListingImportJob.JobStatus.PENDING
+    ).update(status=ListingImportJob.JobStatus.RUNNING)
+    if not claimed:
+        return
+
+    job = ListingImportJob.objects.select_related("seller").get(id=job_id)
+    try:
+        with job.file.open("rb") as file:
+            job.report = import_listings(job.seller, read_rows(file, job.format))
+        job.status = ListingImportJob.JobStatus.DONE
+    except Exception as e:
+        logger.error(f"Import {job_id} failed: {str(e)}")
+        job.status = ListingImportJob.JobStatus.FAILED
+        job.error = "The import stopped, rows before it may have been created."
+
+    # Clearing the file has it deleted from storage
+    job.file = None
+    job.finished_at = timezone.now()
+    job.save(update_fields=["report", "status", "error", "file", "finished_at"])
+
+    if job.report:
+        logger.info(
+            f"Import {job_id}: {job.report['created']} listings created, "
+            f"{job.report['failed']} rows failed"
+        )
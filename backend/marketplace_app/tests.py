@@ -1,12 +1,68 @@
+import asyncio
+import ipaddress
+import json
 import pytest
+import socket
+import stripe
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
 from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction, IntegrityError
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import QueryDict
 from django.urls import reverse
 from django.utils import timezone
 from unittest.mock import patch
-from .tasks import clean_expired_orders, clean_inactive
-from .models import Listing, User, Order, OrderItem, Cart
-from .services import create_order, add_to_cart, order_success
+from .tasks import (
+    clean_expired_orders,
+    clean_inactive,
+    sync_redis_stock,
+    consume_stripe_events,
+    backfill_seller_sales,
+    fetch_listing_images,
+    import_listing_file,
+    is_public_address,
+    PinnedAddressAdapter,
+)
+from .models import (
+    Listing,
+    ListingImage,
+    ListingImportJob,
+    User,
+    Order,
+    OrderItem,
+    OrderParticipant,
+    Cart,
+    StripeEvent,
+    SellerDailySales,
+)
+from .services import (
+    create_order,
+    add_to_cart,
+    order_success,
+    cancel_order,
+    create_listing,
+    update_listing,
+)
+from .stock import held_orders, release_stock, reserved_stock
+from .caching import idempotency_lock_timeout, single_flight, listing_page_key
+from .fake_stripe import FakeStripe, FakeStripeHandler
+from .imports import read_rows
+from .pagination import KeysetPagination
+from .views import OrderViewSet
+from .payments import PaymentError, PaymentGateway, payment_gateway
 from freezegun import freeze_time
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.pagination import Cursor
+from rest_framework.response import Response
 
 
 def create_order(client, buyer, listing, quantity=1):
@@ -20,7 +76,7 @@ def create_order(client, buyer, listing, quantity=1):
     url = reverse('order-list')
 
     # Mock stripe
-    with patch('marketplace_app.services.stripe.PaymentIntent.create') as mock_create:
+    with patch('marketplace_app.payments.stripe.PaymentIntentService.create') as mock_create:
         mock_create.return_value = type('obj', (object,), {
             'id': 'pi_12345',
             'client_secret': 'secret_123',
@@ -51,12 +107,35 @@ def test_order_success(client, buyer, listing):
     assert order.status == Order.PaymentStatus.PAID
 
 
+@pytest.mark.django_db
+def test_order_success_multiple_listings(client, buyer, seller, listing):
+    last = Listing.objects.create(title="Last one", price=10, quantity=1, seller=seller)
+    add_to_cart(buyer, last, 1)
+    _, order = create_order(client, buyer, listing, quantity=2)
+
+    with CaptureQueriesContext(connection) as queries:
+        order_success(order.id)
+    # Same statements whatever the number of listings
+    assert len(queries) <= 10
+
+    listing.refresh_from_db()
+    last.refresh_from_db()
+    assert (listing.quantity, listing.status) == (8, Listing.ListingStatus.IN_STOCK)
+    assert (last.quantity, last.status) == (0, Listing.ListingStatus.OUT_OF_STOCK)
+    assert set(order.items.values_list("status", flat=True)) == {
+        OrderItem.ShippingStatus.AWAITING_SHIPMENT
+    }
+    assert reserved_stock([listing.id, last.id]) == {listing.id: 0, last.id: 0}
+
+
 @pytest.mark.django_db
 def test_stripe_webhook(client, buyer, listing):
     _, order = create_order(client, buyer, listing)
 
     payload = {
+        "id": "evt_12345",
         "type": "payment_intent.succeeded",
+        "created": int(timezone.now().timestamp()),
         "data": {
             "object": {
                 "id": "pi_12345",
@@ -70,16 +149,49 @@ def test_stripe_webhook(client, buyer, listing):
     with patch('stripe.Webhook.construct_event') as mock_stripe:
         mock_stripe.return_value = payload
 
-        response = client.post(
-            url,
-            data=payload,
-            format='json',
-            HTTP_STRIPE_SIGNATURE="fake_signature"
-        )
+        # Stripe retries are stored once
+        for _ in range(2):
+            response = client.post(
+                url,
+                data=payload,
+                format='json',
+                HTTP_STRIPE_SIGNATURE="fake_signature"
+            )
 
     assert response.status_code == 204
+    event = StripeEvent.objects.get()
+    assert (event.id, event.order_id) == ("evt_12345", order.id)
+    assert event.status == StripeEvent.EventStatus.PENDING
+
+    # The order is paid by the consumer, not the webhook request
     order.refresh_from_db()
+    assert order.status == Order.PaymentStatus.PENDING
+
+    consume_stripe_events(str(order.id))
+
+    order.refresh_from_db()
+    event.refresh_from_db()
     assert order.status == Order.PaymentStatus.PAID
+    assert (event.status, event.attempts) == (StripeEvent.EventStatus.PROCESSED, 1)
+
+    # Replaying is safe, the order is already paid
+    call_command("replay_stripe_events", "evt_12345", stdout=StringIO())
+    event.refresh_from_db()
+    assert (event.status, event.attempts) == (StripeEvent.EventStatus.PROCESSED, 2)
+
+    # Malformed metadata is acknowledged and ignored, not retried by Stripe
+    payload = {**payload, "id": "evt_67890"}
+    payload["data"] = {"object": {"id": "pi_12345", "metadata": {"order_id": "42"}}}
+    with patch('stripe.Webhook.construct_event') as mock_stripe:
+        mock_stripe.return_value = payload
+        response = client.post(
+            url, data=payload, format='json', HTTP_STRIPE_SIGNATURE="fake_signature"
+        )
+
+    assert response.status_code == 204
+    event = StripeEvent.objects.get(id="evt_67890")
+    assert (event.order_id, event.status) == (None, StripeEvent.EventStatus.IGNORED)
+    assert "42" in event.error
 
 
 @pytest.mark.django_db
@@ -95,8 +207,8 @@ def test_refund(client, buyer, listing):
 
     url = reverse('order-refund', kwargs={'id': order.id})
 
-    with patch('marketplace_app.services.stripe.PaymentIntent.retrieve') as mock_retrieve, \
-         patch('marketplace_app.services.stripe.Refund.create') as mock_refund:
+    with patch('marketplace_app.payments.stripe.PaymentIntentService.retrieve') as mock_retrieve, \
+         patch('marketplace_app.payments.stripe.RefundService.create') as mock_refund:
         
         mock_refund.return_value = type('obj', (object,), {
             'id': 'rf_12345',
@@ -139,6 +251,29 @@ def test_expired_order(client, buyer, listing):
     assert listing.available_stock == initial_stock
 
 
+@pytest.mark.django_db
+def test_expired_orders_batch(client, buyer, listing):
+    Listing.objects.filter(id=listing.id).update(quantity=2)
+    listing.refresh_from_db()
+
+    with freeze_time("2026-01-01 12:00:00"):
+        orders = [create_order(client, buyer, listing)[1] for _ in range(2)]
+        Order.objects.filter(id__in=[order.id for order in orders]).update(created_at=timezone.now())
+
+    listing.refresh_from_db()
+    assert listing.status == Listing.ListingStatus.OUT_OF_STOCK
+
+    # Every batch is cancelled with the same statements
+    with freeze_time("2026-01-01 12:16:00"), patch('marketplace_app.tasks.EXPIRED_ORDERS_BATCH', 1):
+        clean_expired_orders()
+
+    listing.refresh_from_db()
+    assert listing.status == Listing.ListingStatus.IN_STOCK
+    assert listing.available_stock == 2
+    assert not Order.objects.exclude(status=Order.PaymentStatus.CANCELLED).exists()
+    assert not OrderItem.objects.exclude(status=OrderItem.ShippingStatus.CANCELLED).exists()
+
+
 @pytest.mark.django_db
 def test_shipping(client, buyer, seller, listing):
     response, order = create_order(client, buyer, listing)
@@ -154,6 +289,57 @@ def test_shipping(client, buyer, seller, listing):
     assert tracking_response.status_code == 204
 
 
+@pytest.mark.django_db
+def test_ship_items(client, buyer, seller, listing):
+    _, first = create_order(client, buyer, listing)
+    order_success(first.id)
+    _, second = create_order(client, buyer, listing, quantity=2)
+    order_success(second.id)
+    _, pending = create_order(client, buyer, listing)
+
+    other = User.objects.create_user(username='other', email='other@mail.com')
+    foreign = Listing.objects.create(title="Foreign", price=5, quantity=5, seller=other)
+    _, foreign_order = create_order(client, buyer, foreign)
+    order_success(foreign_order.id)
+
+    shippable = [first.items.get().id, second.items.get().id]
+    items = [{'id': item_id, 'tracking_code': f'tracking_{item_id}'} for item_id in shippable]
+    items += [
+        {'id': pending.items.get().id, 'tracking_code': 'tracking_pending'},
+        {'id': foreign_order.items.get().id, 'tracking_code': 'tracking_foreign'},
+    ]
+
+    client.force_authenticate(user=seller)
+    url = reverse('order-ship-items')
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url, data={'items': items}, format='json')
+    # Same statements whatever the number of items
+    assert len(queries) <= 8
+
+    assert response.status_code == 200
+    assert response.data['shipped'] == 2
+    assert [result['shipped'] for result in response.data['results']] == [True, True, False, False]
+    assert response.data['results'][2]['error'] == 'Item is not awaiting shipment.'
+    assert response.data['results'][3]['error'] == 'Item not found.'
+
+    shipped = OrderItem.objects.filter(id__in=shippable)
+    assert {(item.status, item.tracking_code) for item in shipped} == {
+        (OrderItem.ShippingStatus.IN_TRANSIT, f'tracking_{item_id}') for item_id in shippable
+    }
+    assert foreign_order.items.get().status == OrderItem.ShippingStatus.AWAITING_SHIPMENT
+
+    sales = SellerDailySales.objects.get(seller=seller)
+    assert (sales.items_awaiting_shipment, sales.items_in_transit) == (0, 2)
+
+    # Repeated items are refused before anything is shipped
+    response = client.post(url, data={'items': items[:1] * 2}, format='json')
+    assert response.status_code == 400
+
+    # Ids out of the bigint range are refused, not sent to the database
+    response = client.post(url, data={'items': [{'id': 2**63, 'tracking_code': 'tracking_big'}]}, format='json')
+    assert response.status_code == 400
+
+
 @pytest.mark.django_db
 def test_listing_soft_delete(client, seller, listing):
     client.force_authenticate(user=seller)
@@ -173,6 +359,45 @@ def test_listing_soft_delete(client, seller, listing):
     assert not Listing.objects.filter(id=listing.id).exists()
 
 
+@pytest.mark.django_db
+def test_clean_inactive_batches(buyer, seller):
+    with freeze_time("2026-01-01 12:00:00"):
+        listings = Listing.objects.bulk_create(
+            Listing(seller=seller, title=f"Item {i}", price=10, is_active=False, inactive_date=timezone.now())
+            for i in range(3)
+        )
+        ListingImage.objects.bulk_create(
+            ListingImage(listing=listing, image=f"{listing.id}.jpg") for listing in listings
+        )
+        User.objects.filter(id=buyer.id).update(is_active=False, inactive_date=timezone.now())
+
+    # A run interrupted after the listings resumes with the users
+    with freeze_time("2026-02-01 12:00:00"):
+        cache.set("clean_inactive:checkpoint", {
+            "time_limit": timezone.now() - timedelta(days=30),
+            "phase": "users",
+            "after": None,
+        })
+        clean_inactive()
+
+    assert not User.objects.filter(id=buyer.id).exists()
+    assert Listing.objects.count() == 3
+    assert cache.get("clean_inactive:checkpoint") is None
+
+    # Files are removed from storage by a task, one per batch
+    with freeze_time("2026-02-01 12:00:00"), \
+         patch('marketplace_app.tasks.INACTIVE_BATCH', 2), \
+         patch('marketplace_app.tasks.delete_stored_files.delay') as delete_files:
+        clean_inactive()
+
+    assert not Listing.objects.exists()
+    assert not ListingImage.objects.exists()
+    assert sorted(name for call in delete_files.call_args_list for name in call.args[0]) == sorted(
+        f"{listing.id}.jpg" for listing in listings
+    )
+    assert delete_files.call_count == 2
+
+
 @pytest.mark.django_db
 def test_user_soft_delete(client, buyer):
     client.force_authenticate(user=buyer)
@@ -197,7 +422,7 @@ def test_buy_self_listing(client, seller, listing):
     client.force_authenticate(user=seller)
     url = reverse('order-list')
 
-    with patch('marketplace_app.services.stripe.PaymentIntent.create') as mock_create:
+    with patch('marketplace_app.payments.stripe.PaymentIntentService.create') as mock_create:
         mock_create.return_value = type('obj', (object,), {
             'id': 'pi_12345',
             'client_secret': 'secret_123',
@@ -205,4 +430,932 @@ def test_buy_self_listing(client, seller, listing):
 
         response = client.post(url)
     
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_order_reservation_all_or_nothing(client, buyer, seller, listing):
+    other_listing = Listing.objects.create(
+        title="Other Item", price=50, quantity=2, seller=seller
+    )
+    add_to_cart(buyer, listing, 1)
+    add_to_cart(buyer, other_listing, 2)
+
+    # Another buyer already holds part of the second listing
+    cache.set(f"reserved_stock:{other_listing.id}", 1, timeout=3600)
+
+    client.force_authenticate(user=buyer)
+    response = client.post(reverse('order-list'))
+
+    assert response.status_code == 400
+    assert "Insufficient stock" in response.data['detail']
+    # Nothing reserved for the first listing
+    assert cache.get(f"reserved_stock:{listing.id}", 0) == 0
+    assert cache.get(f"reserved_stock:{other_listing.id}") == 1
+    assert not Order.objects.filter(buyer=buyer).exists()
+
+
+@pytest.mark.django_db
+def test_reservation_ledger_expiry(client, buyer, listing):
+    with freeze_time("2026-01-01 12:00:00"):
+        _, late = create_order(client, buyer, listing, quantity=2)
+        _, refused = create_order(client, buyer, listing, quantity=3)
+
+    listing.refresh_from_db()
+    assert listing.available_stock == 5
+
+    # Past the deadline the next reservation releases the expired ledgers first
+    with freeze_time("2026-01-01 12:16:00"):
+        _, order = create_order(client, buyer, listing, quantity=7)
+
+    listing.refresh_from_db()
+    assert listing.available_stock == 3
+    assert not {late.id, refused.id} & set(held_orders())
+
+    # A late payment takes its stock again while it's free, or is refunded
+    with freeze_time("2026-01-01 12:16:00"), \
+         patch('marketplace_app.payments.stripe.PaymentIntentService.retrieve') as mock_retrieve, \
+         patch('marketplace_app.payments.stripe.RefundService.create') as mock_refund:
+        mock_retrieve.return_value = type('obj', (object,), {
+            'id': 'pi_12345',
+            'status': 'succeeded'
+        })
+        order_success(late.id)
+        order_success(refused.id)
+
+    late.refresh_from_db()
+    refused.refresh_from_db()
+    listing.refresh_from_db()
+    assert late.status == Order.PaymentStatus.PAID
+    assert refused.status == Order.PaymentStatus.CANCELLED
+    assert set(refused.items.values_list("status", flat=True)) == {
+        OrderItem.ShippingStatus.CANCELLED
+    }
+    mock_refund.assert_called_once()
+    assert listing.quantity == 8
+    assert listing.available_stock == 1
+    assert not {late.id, refused.id} & set(held_orders())
+    assert order.id in held_orders()
+
+
+@pytest.mark.django_db
+def test_sync_redis_stock(client, buyer, listing):
+    _, order = create_order(client, buyer, listing)
+
+    # Drift the counter, as if Redis lost writes
+    cache.set(f"reserved_stock:{listing.id}", 5, timeout=None)
+    sync_redis_stock()
+
+    assert cache.get(f"reserved_stock:{listing.id}") == 1
+
+    # A ledger lost by Redis is restored while its order is pending
+    release_stock(order.id)
+    sync_redis_stock()
+    assert order.id in held_orders()
+    assert cache.get(f"reserved_stock:{listing.id}") == 1
+
+    # Past its deadline the ledger is released, and not restored
+    with freeze_time(timezone.now() + timedelta(minutes=16)):
+        sync_redis_stock()
+    assert order.id not in held_orders()
+    assert reserved_stock([listing.id])[listing.id] == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sync_redis_stock_skips_orders_being_paid(client, buyer, listing):
+    _, order = create_order(client, buyer, listing)
+    released, paid = threading.Event(), threading.Event()
+
+    # order_success holds the order lock between releasing the ledger and committing
+    def pay():
+        with transaction.atomic():
+            Order.objects.select_for_update().get(id=order.id)
+            release_stock(order.id)
+            released.set()
+            paid.wait(5)
+        connection.close()
+
+    thread = threading.Thread(target=pay)
+    thread.start()
+    released.wait(5)
+    sync_redis_stock()
+    paid.set()
+    thread.join()
+
+    assert order.id not in held_orders()
+    assert reserved_stock([listing.id])[listing.id] == 0
+
+
+@pytest.mark.django_db
+def test_listing_list_stock(client, seller, listing):
+    other_listing = Listing.objects.create(
+        title="Other Item", price=50, quantity=3, seller=seller
+    )
+    cache.set(f"reserved_stock:{listing.id}", 4, timeout=None)
+    cache.delete(f"reserved_stock:{other_listing.id}")
+
+    with patch('marketplace_app.serializers.reserved_stock', wraps=reserved_stock) as mock_stock:
+        response = client.get(reverse('listings-list'))
+
+    # Whole page resolved at once
+    assert mock_stock.call_count == 1
+    stock = {item['id']: item['available_stock'] for item in response.data['results']}
+    assert stock[str(listing.id)] == 6
+    assert stock[str(other_listing.id)] == 3
+
+
+@pytest.mark.django_db
+def test_listing_keyset_pagination(client, seller):
+    listings = [
+        Listing.objects.create(title=f"Item {i}", price=10, quantity=1, seller=seller)
+        for i in range(5)
+    ]
+
+    # Same price on every listing, ties are broken by id
+    url = reverse('listings-list') + '?ordering=price&page_size=2'
+    seen = []
+    pages = []
+    while url:
+        response = client.get(url)
+        pages.append(response.data)
+        seen += [item['id'] for item in response.data['results']]
+        url = response.data['next']
+
+    assert seen == [str(listing.id) for listing in listings]
+    assert len(pages) == 3
+
+    previous = client.get(pages[-1]['previous'])
+    assert previous.data['results'] == pages[1]['results']
+
+    # Tampered cursors are refused before reaching the query
+    paginator = KeysetPagination()
+    for position in (['10.00', 'not-a-uuid'], ['ten', str(listings[0].id)], {'price': 1}):
+        paginator.base_url = 'http://testserver' + reverse('listings-list') + '?ordering=price'
+        cursor = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=json.dumps(position)))
+        assert client.get(cursor).status_code == 404
+
+    response = client.get(reverse('listings-list'), {'ordering': 'price,-created_at'})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_listing_full_text_search(client, seller):
+    tripod = Listing.objects.create(
+        title="Tripod", description="Fits any camera", price=30, quantity=1, seller=seller
+    )
+    camera = Listing.objects.create(
+        title="Vintage Camera", price=150, quantity=1, seller=seller
+    )
+    Listing.objects.create(title="Desk Lamp", price=20, quantity=1, seller=seller)
+
+    # Prefix match, title ranked above description
+    response = client.get(reverse('listings-list'), {'search': 'came'})
+    ids = [item['id'] for item in response.data['results']]
+    assert ids == [str(camera.id), str(tripod.id)]
+
+    # Ranked results page on the rank
+    response = client.get(reverse('listings-list'), {'search': 'came', 'page_size': 1})
+    next_page = client.get(response.data['next'])
+    assert [item['id'] for item in next_page.data['results']] == [str(tripod.id)]
+
+    # Seller username still matches
+    response = client.get(reverse('listings-list'), {'search': 'seller'})
+    assert len(response.data['results']) == 3
+
+    # Along with other terms, each of which still has to match
+    response = client.get(reverse('listings-list'), {'search': 'seller lamp'})
+    assert [item['title'] for item in response.data['results']] == ["Desk Lamp"]
+
+
+@pytest.mark.django_db
+def test_listing_autocomplete(client, seller):
+    Listing.objects.create(title="Old camera bag", price=20, quantity=1, seller=seller)
+    camera = Listing.objects.create(title="Camera", price=150, quantity=1, seller=seller)
+    Listing.objects.create(
+        title="Camera lens", price=80, quantity=1, seller=seller, is_active=False
+    )
+    cache.delete_pattern("autocomplete:*")
+
+    response = client.get(reverse('listings-autocomplete'), {'q': 'CAM'})
+
+    assert response.status_code == 200
+    # Prefix matches first, inactive listings excluded
+    assert [item['title'] for item in response.data] == ["Camera", "Old camera bag"]
+    assert set(response.data[0]) == {'id', 'title', 'price', 'main_image'}
+    assert response.data[0]['id'] == str(camera.id)
+
+    # Repeated prefixes are served from Redis
+    Listing.objects.filter(id=camera.id).delete()
+    response = client.get(reverse('listings-autocomplete'), {'q': 'cam'})
+    assert len(response.data) == 2
+
+
+@pytest.mark.django_db
+def test_order_list_query_count(client, buyer, seller):
+    def place_order():
+        listing = Listing.objects.create(title="Item", price=10, quantity=5, seller=seller)
+        listing.main_image = ListingImage.objects.create(
+            listing=listing, image="item.jpg", is_main=True
+        )
+        listing.save(update_fields=["main_image"])
+        ListingImage.objects.create(listing=listing, image="other.jpg")
+        create_order(client, buyer, listing)
+
+    def list_orders(user, params=None):
+        client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('order-list'), params)
+        return response, len(queries)
+
+    place_order()
+    response, single = list_orders(buyer)
+    assert response.data['results'][0]['items'][0]['listing_image'].endswith("item.jpg")
+    _, seller_single = list_orders(seller, {'view': 'seller'})
+
+    for _ in range(3):
+        place_order()
+    response, many = list_orders(buyer)
+    seller_response, seller_many = list_orders(seller, {'view': 'seller'})
+
+    # Images, roles and items come from the prefetch, not a query per order
+    assert len(response.data['results']) == 4
+    assert many == single
+    assert {order['user_role'] for order in seller_response.data['results']} == {'seller'}
+    assert seller_many == seller_single
+
+
+@pytest.mark.django_db
+def test_order_participants(client, buyer, seller, listing):
+    _, order = create_order(client, buyer, listing)
+
+    assert set(order.participants.values_list('user_id', 'role')) == {
+        (buyer.id, OrderParticipant.Role.BUYER),
+        (seller.id, OrderParticipant.Role.SELLER),
+    }
+
+    order_success(order.id)
+    url = reverse('order-detail', kwargs={'id': order.id})
+    client.force_authenticate(user=seller)
+    assert client.get(url).data['user_role'] == 'seller'
+
+    stranger = User.objects.create_user(username='stranger', email='stranger@mail.com')
+    client.force_authenticate(user=stranger)
+    assert client.get(url).status_code == 404
+
+
+@pytest.mark.django_db
+def test_listing_main_image(listing):
+    first = ListingImage.objects.create(listing=listing, image="first.jpg", is_main=True)
+    second = ListingImage.objects.create(listing=listing, image="second.jpg")
+    third = ListingImage.objects.create(listing=listing, image="third.jpg")
+    listing.main_image = first
+    listing.save(update_fields=["main_image"])
+
+    # Switching the main image keeps a single flagged image
+    update_listing(listing, {}, {}, {"main_image_id": str(third.id)})
+    assert listing.main_image == third
+    assert list(listing.images.filter(is_main=True)) == [third]
+
+    # Deleting the main image falls back to the oldest remaining one
+    with CaptureQueriesContext(connection) as queries:
+        update_listing(listing, {}, {}, {"deleted_images": json.dumps([str(third.id)])})
+    assert listing.main_image == first
+    assert list(listing.images.filter(is_main=True)) == [first]
+    assert len(queries) <= 10
+
+    # The database refuses a second main image
+    with pytest.raises(IntegrityError), transaction.atomic():
+        ListingImage.objects.filter(id=second.id).update(is_main=True)
+
+
+@pytest.mark.django_db
+def test_seller_sales(client, buyer, seller, listing):
+    _, shipped = create_order(client, buyer, listing, quantity=2)
+    order_success(shipped.id)
+    _, refunded = create_order(client, buyer, listing)
+    order_success(refunded.id)
+
+    client.force_authenticate(user=seller)
+    item = shipped.items.get()
+    url = reverse('order-mark-shipped', kwargs={'id': shipped.id})
+    client.post(url, data={'tracking_code': 'tracking_123', 'item_ids': [item.id]}, format='json')
+
+    refunded.refresh_from_db()
+    with patch('marketplace_app.services.payment_gateway'):
+        cancel_order(refunded, buyer)
+
+    # Kept up to date by the order services, the refunded order is taken back out
+    sales = SellerDailySales.objects.get(seller=seller)
+    expected = (sales.day, 200, 2, 1, 0, 1, 0)
+    columns = ['day', 'revenue', 'units', 'orders', 'items_awaiting_shipment', 'items_in_transit', 'items_delivered']
+    assert tuple(getattr(sales, column) for column in columns) == expected
+
+    # The backfill rebuilds the same rows from the order items
+    SellerDailySales.objects.update(revenue=0, units=0, orders=0, items_in_transit=0)
+    backfill_seller_sales()
+    sales = SellerDailySales.objects.get(seller=seller)
+    assert tuple(getattr(sales, column) for column in columns) == expected
+
+    response = client.get(reverse('user-sales'))
+    assert response.status_code == 200
+    assert response.data['totals']['revenue'] == '200.00'
+    assert [day['units'] for day in response.data['days']] == [2]
+
+    response = client.get(reverse('user-sales'), {'start': '2026-02-01', 'end': '2026-01-01'})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+@override_settings(TIME_ZONE='Pacific/Auckland')
+def test_seller_sales_day(client, buyer, seller, listing):
+    # Evening in UTC and New York is already the next day in Auckland
+    with freeze_time('2026-01-10 20:00:00'), timezone.override('America/New_York'):
+        _, order = create_order(client, buyer, listing)
+        order_success(order.id)
+        assert SellerDailySales.objects.get(seller=seller).day.isoformat() == '2026-01-11'
+
+        backfill_seller_sales()
+        assert SellerDailySales.objects.get(seller=seller).day.isoformat() == '2026-01-11'
+
+
+@pytest.mark.django_db
+def test_listing_detail_cache(
+    client, buyer, seller, listing, django_capture_on_commit_callbacks
+):
+    url = reverse('listings-detail', kwargs={'pk': listing.id})
+    etag = client.get(url)['ETag']
+
+    # Unchanged listings are revalidated from Redis without touching the database
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert len(queries) == 0
+
+    # Other spellings of the id share its keys, malformed ids are not found
+    spelled = reverse('listings-detail', kwargs={'pk': listing.id.hex.upper()})
+    assert client.get(spelled, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    bad = reverse('listings-detail', kwargs={'pk': 'not-a-uuid'})
+    assert client.get(bad).status_code == 404
+
+    # Reservations change the stock, and so the ETag, without a new version
+    create_order(client, buyer, listing)
+    client.force_authenticate(user=None)
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data['available_stock'] == listing.quantity - 1
+
+    # Edits bump the listing version
+    with django_capture_on_commit_callbacks(execute=True):
+        update_listing(listing, {"title": "Renamed item"}, {}, {})
+    assert client.get(url).data['title'] == "Renamed item"
+
+    # Profile changes of the seller show on their listings
+    client.force_authenticate(user=seller)
+    with django_capture_on_commit_callbacks(execute=True):
+        client.patch(reverse('user-me'), {'city': 'Lisbon'}, format='json')
+    client.force_authenticate(user=None)
+    assert client.get(url).data['seller']['city'] == 'Lisbon'
+
+    # Deactivated listings stay visible to their seller only
+    with django_capture_on_commit_callbacks(execute=True):
+        listing.soft_delete()
+    assert client.get(url).status_code == 404
+    client.force_authenticate(user=seller)
+    assert client.get(url).status_code == 200
+
+
+@pytest.mark.django_db
+def test_listing_page_cache(
+    client, seller, listing, django_capture_on_commit_callbacks
+):
+    url = reverse('listings-list')
+    params = {'ordering': '-price', 'page_size': 10}
+    client.get(url, params)
+
+    # Anonymous visitors share the page whatever the params order or blanks
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, {'search': ' ', **params})
+    assert len(queries) == 0
+    assert [item['id'] for item in response.data['results']] == [str(listing.id)]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        new = create_listing(
+            seller, {"title": "Lamp", "price": 5, "quantity": 1}, {}, None
+        )
+
+    # While another request refreshes the page, the stale one is served
+    key = listing_page_key(QueryDict('ordering=-price&page_size=10'))
+    cache.add(f"{key}:lock", 1)
+    response = client.get(url, params)
+    assert len(response.data['results']) == 1
+
+    cache.delete(f"{key}:lock")
+    response = client.get(url, params)
+    assert [item['id'] for item in response.data['results']] == [
+        str(listing.id),
+        str(new.id),
+    ]
+
+
+def test_single_flight():
+    cache.delete_many(["flight", "flight:lock"])
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return len(calls)
+
+    def count(result):
+        return REGISTRY.get_sample_value(
+            "marketplace_cache_requests_total", {"cache": "test", "result": result}
+        )
+
+    # Concurrent misses compute once, the other requests wait for it
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight("test", "flight", compute, 60))
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [1, 1, 1, 1]
+    assert count("miss") == 1
+    assert count("coalesced") == 3
+
+    assert single_flight("test", "flight", compute, 60) == 1
+    assert count("hit") == 1
+
+    # A new version is computed by one request, the others get the previous value
+    cache.add("flight:lock", 1)
+    assert single_flight("test", "flight", compute, 60, version=2) == 1
+    assert count("stale") == 1
+    cache.delete("flight:lock")
+    assert single_flight("test", "flight", compute, 60, version=2) == 2
+
+    # A request giving up on the lock computes without storing or releasing it
+    cache.delete("flight")
+    cache.add("flight:lock", 1)
+    with patch('marketplace_app.caching.SINGLE_FLIGHT_WAIT', 0.1):
+        assert single_flight("test", "flight", compute, 60) == 3
+    assert count("timeout") == 1
+    assert cache.get("flight") is None
+    assert cache.get("flight:lock") == 1
+
+    # The owner only releases its own lock, not one taken after it expired
+    def steal():
+        cache.set("flight:lock", 2)
+        return 4
+
+    cache.delete("flight:lock")
+    assert single_flight("test", "flight", steal, 60) == 4
+    assert cache.get("flight:lock") == 2
+    cache.delete("flight:lock")
+
+
+@pytest.mark.django_db
+def test_order_idempotency_key(
+    client, buyer, listing, django_capture_on_commit_callbacks
+):
+    add_to_cart(buyer, listing, 1)
+    client.force_authenticate(user=buyer)
+    url = reverse('order-list')
+
+    with patch('marketplace_app.payments.stripe.PaymentIntentService.create') as mock_create:
+        mock_create.return_value = type('obj', (object,), {
+            'id': 'pi_12345',
+            'client_secret': 'secret_123',
+        })
+
+        first = client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        second = client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        reused = client.post(
+            url, {'order_id': first.data['id']}, HTTP_IDEMPOTENCY_KEY='checkout-1'
+        )
+
+    assert first.status_code == second.status_code == 201
+    assert second.data['id'] == first.data['id']
+    assert reused.status_code == 422
+    assert Order.objects.filter(buyer=buyer).count() == 1
+    assert mock_create.call_count == 1
+    assert mock_create.call_args.kwargs['options']['idempotency_key'] == f"order:{first.data['id']}:intent:new"
+
+    # A retry that read nothing before the first request stored its response
+    # replays it once it gets the lock
+    stored = cache.get(f"idempotency:order:{buyer.id}:checkout-1")
+    with patch('marketplace_app.views.cache.get', side_effect=[None, stored]):
+        retried = client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+    assert retried.status_code == 201
+    assert retried.data['id'] == first.data['id']
+    assert mock_create.call_count == 1
+
+    # The lock outlives the slowest checkout, every Stripe attempt timing out
+    with override_settings(STRIPE_CONNECT_TIMEOUT=3, STRIPE_READ_TIMEOUT=10, STRIPE_MAX_RETRIES=2):
+        assert idempotency_lock_timeout() > 2 * (3 * (3 + 10) + 2 * 5)
+
+    # A request whose lock expired leaves the lock taken after it alone
+    lock = f"idempotency:order:{buyer.id}:checkout-2:lock"
+
+    def slow_checkout(user, order_id):
+        cache.set(lock, 'other-request')
+        return Response(status=400)
+
+    with patch.object(OrderViewSet, 'checkout', side_effect=slow_checkout):
+        client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-2')
+    assert cache.get(lock) == 'other-request'
+    cache.delete(lock)
+
+    # Polling a pending order reads the intent status once
+    detail = reverse('order-detail', kwargs={'id': first.data['id']})
+    with patch('marketplace_app.payments.stripe.PaymentIntentService.retrieve') as mock_retrieve:
+        mock_retrieve.return_value = type('obj', (object,), {
+            'amount': 10000,
+            'status': 'requires_payment_method',
+            'client_secret': 'secret_123',
+        })
+
+        for _ in range(3):
+            response = client.get(detail)
+            assert response.status_code == 200
+
+    assert mock_retrieve.call_count == 1
+
+    # A paid order drops the cached intent and its client secret
+    assert cache.get('payment_intent:pi_12345') is not None
+    with django_capture_on_commit_callbacks(execute=True):
+        order_success(first.data['id'])
+    assert cache.get('payment_intent:pi_12345') is None
+
+
+@pytest.mark.django_db
+def test_fake_stripe_checkout(client, buyer, listing):
+    server = FakeStripe(('127.0.0.1', 0), webhook_secret='whsec_fake', confirm_after=None)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    created = {'operation': 'create_intent', 'result': 'ok'}
+    before = REGISTRY.get_sample_value('marketplace_payment_call_seconds_count', created) or 0
+
+    try:
+        with override_settings(
+            STRIPE_SECRET_KEY='sk_test_fake',
+            STRIPE_WEBHOOK_SECRET='whsec_fake',
+            STRIPE_API_BASE=f'http://127.0.0.1:{server.server_port}',
+        ):
+            payment_gateway.cache_clear()
+
+            add_to_cart(buyer, listing, 1)
+            client.force_authenticate(user=buyer)
+            response = client.post(reverse('order-list'))
+            assert response.status_code == 201
+            order = Order.objects.get(id=response.data['id'])
+            intent = server.intents[order.intent_id]
+            assert intent['amount'] == 10000
+            assert intent['metadata']['order_id'] == str(order.id)
+            assert REGISTRY.get_sample_value(
+                'marketplace_payment_call_seconds_count', created
+            ) == before + 1
+
+            # Signed like Stripe, a tampered signature is refused
+            intent['status'] = 'succeeded'
+            payload, signature = server.sign(server.event('payment_intent.succeeded', intent))
+            url = reverse('stripe_webhook')
+            response = client.generic(
+                'POST', url, payload, 'application/json', HTTP_STRIPE_SIGNATURE=signature + '0'
+            )
+            assert response.status_code == 400
+            response = client.generic(
+                'POST', url, payload, 'application/json', HTTP_STRIPE_SIGNATURE=signature
+            )
+            assert response.status_code == 204
+
+            consume_stripe_events(str(order.id))
+            order.refresh_from_db()
+            assert order.status == Order.PaymentStatus.PAID
+
+            response = client.post(reverse('order-refund', kwargs={'id': order.id}))
+            assert response.status_code == 204
+            assert intent['status'] == 'refunded'
+    finally:
+        server.shutdown()
+        server.server_close()
+        payment_gateway.cache_clear()
+
+
+def test_stripe_timeouts_and_retries():
+    server = FakeStripe(('127.0.0.1', 0), confirm_after=None)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    calls = []
+    handle_call = FakeStripeHandler.handle_call
+
+    def counted(handler, route):
+        calls.append(handler.path)
+        return handle_call(handler, route)
+
+    try:
+        with override_settings(
+            STRIPE_SECRET_KEY='sk_test_fake',
+            STRIPE_API_BASE=f'http://127.0.0.1:{server.server_port}',
+            STRIPE_CONNECT_TIMEOUT=1,
+            STRIPE_READ_TIMEOUT=0.2,
+            STRIPE_MAX_RETRIES=2,
+        ), patch.object(FakeStripeHandler, 'handle_call', counted), \
+             patch.object(stripe._http_client.HTTPClient, 'INITIAL_DELAY', 0.01):
+            payment_gateway.cache_clear()
+            gateway = payment_gateway()
+
+            # Failed calls are retried STRIPE_MAX_RETRIES times
+            server.failure_rate = 1
+            with pytest.raises(PaymentError):
+                gateway.create_intent(100, {}, idempotency_key='retries')
+            assert len(calls) == 3
+
+            # Calls slower than STRIPE_READ_TIMEOUT are given up
+            server.failure_rate = 0
+            server.latency = 1000
+            start = time.monotonic()
+            with pytest.raises(PaymentError):
+                gateway.retrieve_intent('pi_missing')
+            assert time.monotonic() - start < 3
+            assert len(calls) == 6
+    finally:
+        server.shutdown()
+        server.server_close()
+        payment_gateway.cache_clear()
+
+
+def test_stripe_async_gateway():
+    server = FakeStripe(('127.0.0.1', 0), confirm_after=None)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    calls = []
+    handle_call = FakeStripeHandler.handle_call
+
+    def counted(handler, route):
+        calls.append(handler.path)
+        return handle_call(handler, route)
+
+    async def checkout(gateway):
+        intent = await gateway.create_intent_async(100, {'order_id': 1}, idempotency_key='async')
+        status = await gateway.retrieve_intent_async(intent['id'])
+        await gateway.refund_intent_async(intent['id'])
+        return intent, status
+
+    async def failing(gateway):
+        server.failure_rate = 1
+        with pytest.raises(PaymentError):
+            await gateway.create_intent_async(100, {}, idempotency_key='async-retries')
+
+        server.failure_rate = 0
+        server.latency = 1000
+        start = time.monotonic()
+        with pytest.raises(PaymentError):
+            await gateway.retrieve_intent_async('pi_missing')
+        return time.monotonic() - start
+
+    try:
+        with override_settings(
+            STRIPE_SECRET_KEY='sk_test_fake',
+            STRIPE_API_BASE=f'http://127.0.0.1:{server.server_port}',
+            STRIPE_CONNECT_TIMEOUT=1,
+            STRIPE_READ_TIMEOUT=0.2,
+            STRIPE_MAX_RETRIES=2,
+            STRIPE_POOL_SIZE=4,
+        ), patch.object(FakeStripeHandler, 'handle_call', counted), \
+             patch.object(stripe._http_client.HTTPClient, 'INITIAL_DELAY', 0.01):
+            payment_gateway.cache_clear()
+            gateway = payment_gateway()
+
+            # Intents are paid, read and cancelled on the async client
+            intent, status = asyncio.run(checkout(gateway))
+            assert status['status'] == 'requires_payment_method'
+            assert server.intents[intent['id']]['status'] == 'canceled'
+            assert len(calls) == 4
+
+            # Its pool, retries and timeouts come from the settings
+            pool = gateway.async_client._requestor._client._client_async._transport._pool
+            assert pool._max_connections == 4
+            assert asyncio.run(failing(gateway)) < 3
+            assert len(calls) == 4 + 3 + 3
+    finally:
+        server.shutdown()
+        server.server_close()
+        payment_gateway.cache_clear()
+
+    # Gateways without async calls of their own run the sync ones on a thread
+    class SyncGateway(PaymentGateway):
+        def create_intent(self, amount, metadata, idempotency_key):
+            return {'id': idempotency_key, 'client_secret': 'secret'}
+
+        def retrieve_intent(self, intent_id):
+            pass
+
+        def refund_intent(self, intent_id):
+            pass
+
+        def construct_event(self, payload, signature):
+            pass
+
+    intent = asyncio.run(SyncGateway().create_intent_async(100, {}, 'sync'))
+    assert intent == {'id': 'sync', 'client_secret': 'secret'}
+
+
+@pytest.mark.django_db
+def test_index_usage(client):
+    client.get(reverse('listings-list'))
+
+    output = StringIO()
+    call_command('index_usage', stdout=output)
+    assert 'listing_active_created_idx' in output.getvalue()
+
+    output = StringIO()
+    call_command('index_usage', '--unused', stdout=output)
+    assert 'marketplace_app_listing_pkey' not in output.getvalue()
+
+
+def run_import(client, url, upload, django_capture_on_commit_callbacks):
+    # The upload is queued, the job is run like a worker would once it commits
+    with patch('marketplace_app.views.import_listing_file.delay') as mock_import, \
+         django_capture_on_commit_callbacks(execute=True):
+        response = client.post(url, {'file': upload}, format='multipart')
+    if response.status_code != 202:
+        return response
+
+    assert response.data['status'] == ListingImportJob.JobStatus.PENDING
+    mock_import.assert_called_once_with(str(response.data['id']))
+    with django_capture_on_commit_callbacks(execute=True):
+        import_listing_file.apply(args=mock_import.call_args.args)
+    return client.get(reverse('listings-import-status', args=[response.data['id']]))
+
+
+@pytest.mark.django_db
+def test_import_listings(client, seller, buyer, tmp_path, django_capture_on_commit_callbacks):
+    csv_file = SimpleUploadedFile('catalog.csv', (
+        'title,price,quantity,description,image_urls\n'
+        'Lamp,10.50,3,"Desk lamp,\nwhite",https://img.example.com/a.png https://img.example.com/b.png\n'
+        'Chair,0,1,,\n'
+        'Table,99,2,,\n'
+    ).encode())
+
+    client.force_authenticate(user=seller)
+    with patch('marketplace_app.imports.IMPORT_BATCH', 1), \
+         patch('marketplace_app.imports.fetch_listing_images.delay') as mock_fetch, \
+         patch('marketplace_app.tasks.ListingImportJob.save', autospec=True,
+               side_effect=ListingImportJob.save) as mock_save:
+        response = run_import(
+            client, reverse('listings-bulk-import'), csv_file, django_capture_on_commit_callbacks
+        )
+
+    assert response.status_code == 200
+    assert response.data['status'] == ListingImportJob.JobStatus.DONE
+    report = response.data['report']
+    assert (report['created'], report['failed']) == (2, 1)
+    assert report['errors'][0]['line'] == 4
+    assert 'price' in report['errors'][0]['errors']
+
+    # The stored upload is deleted once imported, and a redelivered job isn't run again
+    job = ListingImportJob.objects.get(id=response.data['id'])
+    assert not job.file
+    assert default_storage.listdir(f'users/{seller.id}/imports') == ([], [])
+    import_listing_file.apply(args=[str(job.id)])
+    assert Listing.objects.filter(seller=seller).count() == 2
+
+    # Jobs are only shown to their seller
+    client.force_authenticate(user=buyer)
+    assert client.get(reverse('listings-import-status', args=[job.id])).status_code == 404
+    assert client.get(reverse('listings-import-status', args=['not-a-job'])).status_code == 404
+    client.force_authenticate(user=seller)
+
+    lamp = Listing.objects.get(seller=seller, title='Lamp')
+    assert lamp.description == 'Desk lamp,\nwhite'
+    mock_fetch.assert_called_once_with(
+        str(lamp.id), ['https://img.example.com/a.png', 'https://img.example.com/b.png']
+    )
+
+    path = tmp_path / 'catalog.jsonl'
+    path.write_text(
+        json.dumps({'title': 'Vase', 'price': '5', 'quantity': 1}) + '\n'
+        + '\n'
+        + '{broken\n'
+        + json.dumps(['not', 'a', 'row']) + '\n'
+    )
+    out, err = StringIO(), StringIO()
+    call_command('import_listings', str(path), seller=seller.username, stdout=out, stderr=err)
+    assert '1 listings created, 2 rows failed' in out.getvalue()
+    assert 'Line 3' in err.getvalue() and 'Line 4' in err.getvalue()
+
+    # Images are downloaded and checked like uploads, unreachable ones are retried
+    png = BytesIO()
+    Image.new('RGB', (2, 2)).save(png, format='PNG')
+    hosts = []
+
+    class ImageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hosts.append(self.headers['Host'])
+            if self.path == '/redirect':
+                self.send_response(302)
+                self.send_header('Location', 'http://internal.example.com/a.png')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(png.getvalue())))
+            self.end_headers()
+            self.wfile.write(png.getvalue())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    image_host = f'img.example.com:{server.server_port}'
+
+    # The loopback server stands for a public host resolving to it once, a second
+    # resolution would rebind it to the metadata endpoint
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(host, port, *args, **kwargs):
+        if host == '127.0.0.1':
+            return getaddrinfo(host, port, *args, **kwargs)
+        if host == 'internal.example.com':
+            return [(None, None, None, '', ('10.0.0.1', port))]
+        return next(answers)
+
+    def public(address):
+        return address == ipaddress.ip_address('127.0.0.1') or is_public_address(address)
+
+    answers = iter([
+        [(None, None, None, '', ('127.0.0.1', server.server_port))],
+        [(None, None, None, '', ('169.254.169.254', server.server_port))],
+    ])
+    try:
+        with patch('marketplace_app.tasks.socket.getaddrinfo', side_effect=resolve), \
+             patch('marketplace_app.tasks.is_public_address', side_effect=public), \
+             patch('marketplace_app.tasks.add_listing_images') as mock_add, \
+             patch.dict('os.environ', {'HTTP_PROXY': 'http://10.0.0.2:3128'}):
+            fetch_listing_images.apply(args=[str(lamp.id), [f'http://{image_host}/a.png']])
+
+            listing_id, files = mock_add.call_args.args
+            assert listing_id == str(lamp.id)
+            assert [file.name for file in files] == ['a.png']
+            # Sent to the checked address, for the host of the url, without the proxy
+            assert hosts == [image_host]
+
+            # Internal addresses are never requested, nor redirected to
+            mock_add.reset_mock()
+            internal = ['http://127.0.0.1/a.png', 'http://169.254.169.254/latest', 'http://[::ffff:10.0.0.1]/a.png', 'file:///etc/passwd']
+            with patch('marketplace_app.tasks.is_public_address', side_effect=is_public_address):
+                fetch_listing_images.apply(args=[str(lamp.id), internal])
+
+            answers = iter([[(None, None, None, '', ('127.0.0.1', server.server_port))]])
+            fetch_listing_images.apply(args=[str(lamp.id), [f'http://{image_host}/redirect']])
+            assert hosts == [image_host, image_host]
+            assert not mock_add.called
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Certificates are checked against the host name, not the pinned address
+    adapter = PinnedAddressAdapter('img.example.com')
+    assert adapter.poolmanager.connection_pool_kw['server_hostname'] == 'img.example.com'
+    assert adapter.poolmanager.connection_pool_kw['assert_hostname'] == 'img.example.com'
+
+
+@pytest.mark.django_db
+def test_import_unreadable_files(client, seller, tmp_path, django_capture_on_commit_callbacks):
+    client.force_authenticate(user=seller)
+    url = reverse('listings-bulk-import')
+
+    # Files that aren't UTF-8 are refused before any row is imported
+    latin = 'title,price,quantity\nLamp,10,1\nCaf\xe9 table,99,1\n'.encode('latin-1')
+    response = run_import(
+        client, url, SimpleUploadedFile('catalog.csv', latin), django_capture_on_commit_callbacks
+    )
+    assert response.status_code == 400
+    assert 'Line 3' in response.data['detail']
+    assert not Listing.objects.filter(seller=seller).exists()
+    assert not ListingImportJob.objects.exists()
+
+    path = tmp_path / 'catalog.csv'
+    path.write_bytes(latin)
+    with pytest.raises(CommandError, match='UTF-8'):
+        call_command('import_listings', str(path), seller=seller.username)
+
+    # A CSV cell past the field size limit ends the import with a row error
+    huge = f'title,price,quantity\nLamp,10,1\n"{"x" * 200_000}",10,1\nChair,5,1\n'
+    response = run_import(
+        client, url, SimpleUploadedFile('catalog.csv', huge.encode()), django_capture_on_commit_callbacks
+    )
+    assert response.status_code == 200
+    report = response.data['report']
+    assert (report['created'], report['failed']) == (1, 1)
+    assert report['errors'][0]['line'] == 3
+
+    # JSONL lines that can't be read fail alone
+    rows = [
+        json.dumps({'title': 'Vase', 'price': '5', 'quantity': 1}).encode(),
+        b'{"title": "Caf\xe9"}',
+        b'{broken',
+    ]
+    errors = [error for _, error in read_rows(BytesIO(b'\n'.join(rows)), 'jsonl')][1:]
+    assert [str(error) for error in errors] == ['Line is not UTF-8 encoded.', 'Line is not valid JSON.']
@@ -1,36 +1,71 @@
-import stripe
+import json
+import uuid
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Sum, F
+from django.db import transaction
+from django.db.models import Q, Sum, F, Case, When, Value, Prefetch, prefetch_related_objects
+from django.db.models.functions import Length
 from django.conf import settings
+from django.core.cache import cache
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from django.http import HttpResponse
 from django.utils import timezone
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 from datetime import timedelta
-from rest_framework import viewsets, permissions, filters, generics, status, mixins
+from rest_framework import viewsets, permissions, generics, status, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
 
-from .tasks import clean_expired_orders
-from .models import User, Listing, Cart, CartItem, Order
+from .tasks import clean_expired_orders, consume_stripe_events, import_listing_file
+from .models import (
+    User,
+    Listing,
+    ListingImportJob,
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    OrderParticipant,
+    StripeEvent,
+)
+from .analytics import seller_sales
+from .caching import (
+    IDEMPOTENCY_TIMEOUT,
+    acquire_lock,
+    release_lock,
+    idempotency_lock_timeout,
+    single_flight,
+    cached_listing_detail,
+    cached_listing_page,
+    bump_listing_versions,
+)
+from .imports import FORMATS, check_encoding, import_format
+from .filters import ListingSearchFilter, ListingOrderingFilter
+from .pagination import KeysetPagination
+from .payments import InvalidWebhook, payment_gateway
 from .permissions import IsOwnerOrReadOnly
 from .serializers import (
     CustomTokenObtainSerializer,
     UserSerializer,
     UserPublicSerializer,
     ListingSerializer,
+    ListingImportJobSerializer,
+    ListingSuggestionSerializer,
     RegisterSerializer,
     ChangePasswordSerializer,
     CartSerializer,
     CartItemSerializer,
     OrderSerializer,
+    SellerSalesQuerySerializer,
+    SellerSalesSerializer,
+    ShipItemsSerializer,
 )
 from .services import (
-    order_success,
     register_user,
     create_listing,
     update_listing,
@@ -39,6 +74,9 @@ from .services import (
     add_to_cart,
     create_payment_intent,
     cancel_order,
+    mark_items_shipped,
+    ship_items,
+    record_stripe_event,
 )
 from .schemas import (
     REGISTER_SCHEMA,
@@ -111,22 +149,16 @@ class StripeWebhookView(APIView):
         payload = request.body
         sig_header = request.META.get("HTTP_STRIPE_SIGNATURE")
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
-
         try:
-            event = stripe.Webhook.construct_event(payload, sig_header, endpoint_secret)
-        except ValueError:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        except stripe.error.SignatureVerificationError:
+            event = payment_gateway().construct_event(payload, sig_header)
+        except InvalidWebhook:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        if event["type"] == "payment_intent.succeeded":
-            intent = event["data"]["object"]
-            order_id = intent["metadata"].get("order_id")
-
-            if order_id:
-                order_success(order_id)
+        # Acknowledge once stored, the events of an order are consumed in order
+        stripe_event, created = record_stripe_event(event, json.loads(payload))
+        if created and stripe_event.status == StripeEvent.EventStatus.PENDING:
+            order_id = str(stripe_event.order_id)
+            transaction.on_commit(lambda: consume_stripe_events.delay(order_id))
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -143,8 +175,10 @@ class CartViewSet(viewsets.GenericViewSet):
         if getattr(self, "swagger_fake_view", False):
             return Cart.objects.none()
         
-        return Cart.objects.filter(user=self.request.user).annotate(
-            db_total=Sum(F("items__quantity") * F("items__listing__price"))
+        return (
+            Cart.objects.filter(user=self.request.user)
+            .annotate(db_total=Sum(F("items__quantity") * F("items__listing__price")))
+            .prefetch_related("items__listing__images", "items__listing__seller")
         )
 
     def list(self, request):
@@ -206,6 +240,7 @@ class CartItemViewSet(
     create=ORDER_SCHEMAS["create"],
     retrieve=ORDER_SCHEMAS["retrieve"],
     mark_shipped=ORDER_SCHEMAS["mark_shipped"],
+    ship_items=ORDER_SCHEMAS["ship_items"],
     refund=ORDER_SCHEMAS["refund"],
 )
 class OrderViewSet(
@@ -216,8 +251,16 @@ class OrderViewSet(
 ):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     lookup_field = "id"
 
+    # Items with what the serializer reads of them, so an order costs one query
+    def items_prefetch(self):
+        return Prefetch(
+            "items",
+            queryset=OrderItem.objects.select_related("listing__main_image", "seller"),
+        )
+
     def get_queryset(self):
         if getattr(self, "swagger_fake_view", False):
             return Order.objects.none()
@@ -228,22 +271,79 @@ class OrderViewSet(
 
         queryset = (
             Order.objects.order_by("-created_at")
-            .prefetch_related("items__listing__images", "items__seller")
+            .prefetch_related(self.items_prefetch())
             .select_related("buyer")
         )
 
+        # Orders of the user are read from the participants, without the items join
+        participants = OrderParticipant.objects.filter(user=user)
+
         if list_view:
             if mode == "seller":
-                return queryset.filter(items__seller=user).distinct()
+                return queryset.filter(
+                    id__in=participants.filter(
+                        role=OrderParticipant.Role.SELLER
+                    ).values("order_id")
+                )
             return queryset.filter(buyer=user)
-        return queryset.filter(Q(buyer=user) | Q(items__seller=user)).distinct()
+        return queryset.filter(id__in=participants.values("order_id"))
 
     def create(self, request, *args, **kwargs):
         user = request.user
         order_id = request.data.get("order_id")
 
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if not idempotency_key:
+            return self.checkout(user, order_id)
+
+        # A repeated submission gets the first response, the key can't be reused
+        # for another order
+        key = f"idempotency:order:{user.id}:{idempotency_key}"
+        fingerprint = str(order_id or "")
+        stored = cache.get(key)
+        lock = f"{key}:lock"
+        token = None
+        if stored is None:
+            # Held past the slowest checkout so a retry can't run alongside it
+            token = acquire_lock(lock, idempotency_lock_timeout())
+
+        if token is not None:
+            try:
+                # The request holding the lock before may have stored its response
+                stored = cache.get(key)
+                if stored is not None:
+                    return self.replay(stored, fingerprint)
+
+                response = self.checkout(user, order_id)
+                if response.status_code == status.HTTP_201_CREATED:
+                    cache.set(
+                        key,
+                        {"fingerprint": fingerprint, "data": response.data},
+                        timeout=IDEMPOTENCY_TIMEOUT,
+                    )
+                return response
+            finally:
+                release_lock(lock, token)
+
+        if stored is None:
+            return Response(
+                {"detail": "A request with this Idempotency-Key is in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return self.replay(stored, fingerprint)
+
+    def replay(self, stored, fingerprint):
+        if stored["fingerprint"] != fingerprint:
+            return Response(
+                {"detail": "Idempotency-Key already used for another order."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(stored["data"], status=status.HTTP_201_CREATED)
+
+    def checkout(self, user, order_id):
         try:
             order, client_secret = create_order(user, order_id)
+            prefetch_related_objects([order], self.items_prefetch())
             order.client_secret = client_secret
             serializer = self.get_serializer(order)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -286,18 +386,44 @@ class OrderViewSet(
                 {"error": "Invalid items"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        items = order.items.filter(id__in=items_ids, status="AS")
-
-        items.update(tracking_code=tracking_code, status="IT")
+        mark_items_shipped(order, items_ids, tracking_code)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["post"], url_path="ship")
+    def ship_items(self, request):
+        serializer = ShipItemsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = [
+            (item["id"], item["tracking_code"])
+            for item in serializer.validated_data["items"]
+        ]
+
+        errors = ship_items(request.user, lines)
+
+        results = []
+        for item_id, _ in lines:
+            if item_id in errors:
+                results.append(
+                    {"id": item_id, "shipped": False, "error": errors[item_id]}
+                )
+            else:
+                results.append({"id": item_id, "shipped": True})
+
+        return Response(
+            {"shipped": len(lines) - len(errors), "results": results},
+            status=status.HTTP_200_OK,
+        )
+
 
 @extend_schema_view(
     list=LISTING_SCHEMAS["list"],
     retrieve=LISTING_SCHEMAS["retrieve"],
     create=LISTING_SCHEMAS["create"],
     soft_delete=LISTING_SCHEMAS["soft_delete"],
+    autocomplete=LISTING_SCHEMAS["autocomplete"],
+    bulk_import=LISTING_SCHEMAS["bulk_import"],
+    import_status=LISTING_SCHEMAS["import_status"],
     partial_update=LISTING_SCHEMAS["partial_update"],
     update=extend_schema(exclude=True),
 )
@@ -310,25 +436,25 @@ class ListingViewSet(
 ):
     http_method_names = ["get", "post", "patch", "head", "options"]
     serializer_class = ListingSerializer
+    pagination_class = KeysetPagination
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
-        filters.OrderingFilter,
+        ListingSearchFilter,
+        ListingOrderingFilter,
     ]
     filterset_fields = ["seller__id", "seller__username"]
-    search_fields = ["title", "description", "seller__username"]
     ordering_fields = ["price", "created_at"]
     ordering = ["-created_at"]
     
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ['create', 'bulk_import', 'import_status']:
             return [permissions.IsAuthenticated()]
         return [IsOwnerOrReadOnly()]
 
     def get_queryset(self):
         user = self.request.user
 
-        base_query = Listing.objects.prefetch_related("images")
+        base_query = Listing.objects.select_related("seller").prefetch_related("images")
 
         if self.action in [
             "retrieve",
@@ -378,6 +504,40 @@ class ListingViewSet(
 
         return Response(serializer_response.data, status=status.HTTP_201_CREATED)
 
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        # Anonymous browse pages are the same for every visitor
+        data = cached_listing_page(
+            request.query_params,
+            lambda: super(ListingViewSet, self).list(request, *args, **kwargs).data,
+        )
+        return Response(data, status=status.HTTP_200_OK)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Cache, version and stock keys are built from the canonical id
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        try:
+            listing_id = str(uuid.UUID(str(kwargs[lookup])))
+        except ValueError:
+            raise NotFound()
+        self.kwargs[lookup] = listing_id
+
+        data, etag = cached_listing_detail(
+            listing_id, lambda: self.get_serializer(self.get_object()).data
+        )
+
+        # Active listings are visible to anyone, get_queryset decides who sees the
+        # others, so a cached inactive listing goes through get_object again
+        if not data["is_active"]:
+            self.get_object()
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        return Response(data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
 
@@ -405,11 +565,94 @@ class ListingViewSet(
         new_status = listing.soft_delete()
         return Response({"is_active": new_status}, status=status.HTTP_200_OK)
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[MultiPartParser],
+    )
+    def bulk_import(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"detail": "A CSV or JSONL file is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        file_format = request.data.get("format") or import_format(upload.name)
+        if file_format not in FORMATS.values():
+            return Response(
+                {"detail": "Unsupported file format, use .csv or .jsonl."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            check_encoding(upload)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Imported by a worker, the request only stores the file
+        job = ListingImportJob.objects.create(
+            seller=request.user, file=upload, format=file_format
+        )
+        transaction.on_commit(lambda: import_listing_file.delay(str(job.id)))
+
+        serializer_response = ListingImportJobSerializer(job)
+        return Response(serializer_response.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=["get"], url_path=r"import/(?P<job_id>[^/.]+)")
+    def import_status(self, request, job_id=None):
+        try:
+            job = ListingImportJob.objects.get(
+                id=uuid.UUID(job_id), seller=request.user
+            )
+        except (ValueError, ListingImportJob.DoesNotExist):
+            raise NotFound()
+
+        serializer_response = ListingImportJobSerializer(job)
+        return Response(serializer_response.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"], pagination_class=None, filter_backends=[])
+    def autocomplete(self, request):
+        term = " ".join(request.query_params.get("q", "").lower().split())
+        try:
+            limit = min(int(request.query_params.get("limit", 8)), 20)
+        except ValueError:
+            limit = 8
+
+        if len(term) < 2 or limit < 1:
+            return Response([], status=status.HTTP_200_OK)
+
+        def suggest():
+            # Served by the title trigram index, prefix matches first
+            listings = (
+                Listing.objects.filter(is_active=True, title__icontains=term)
+                .annotate(
+                    prefix_match=Case(
+                        When(title__istartswith=term, then=Value(0)),
+                        default=Value(1),
+                    )
+                )
+                .select_related("main_image")
+                .order_by("prefix_match", Length("title"), "-created_at")[:limit]
+            )
+            return ListingSuggestionSerializer(
+                listings, many=True, context=self.get_serializer_context()
+            ).data
+
+        # Popular prefixes are shared by every visitor typing them
+        suggestions = single_flight(
+            "autocomplete", f"autocomplete:{limit}:{term}", suggest, timeout=60
+        )
+
+        return Response(suggestions, status=status.HTTP_200_OK)
+
 
 @extend_schema_view(
     list=USER_VIEWSET_SCHEMAS['list'],
     retrieve=USER_VIEWSET_SCHEMAS['retrieve'],
     change_password=USER_VIEWSET_SCHEMAS['change_password'],
+    sales=USER_VIEWSET_SCHEMAS['sales'],
 )
 @extend_schema_view(me=USER_VIEWSET_SCHEMAS['me_get'])
 @extend_schema_view(me=USER_VIEWSET_SCHEMAS['me_patch'])
@@ -449,6 +692,10 @@ class UserViewSet(
         serializer = self.get_serializer(user, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+
+        # Cached listings and pages embed the public profile of their seller
+        if set(serializer.validated_data) & set(UserPublicSerializer.Meta.fields):
+            bump_listing_versions(user.listings.values_list("id", flat=True))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["post"], url_path="change-password")
@@ -459,4 +706,12 @@ class UserViewSet(
         if serializer.is_valid(raise_exception=True):
             change_password(request.user, serializer.validated_data["new_password"])
             return Response({"detail": "Password updated."}, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=["get"], url_path="me/sales")
+    def sales(self, request):
+        query = SellerSalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        sales = seller_sales(request.user, **query.validated_data)
+        return Response(SellerSalesSerializer(sales).data, status=status.HTTP_200_OK)
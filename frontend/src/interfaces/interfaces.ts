@@ -65,6 +65,12 @@ export interface OrderInterface {
   seller_id: string;
 }
 
+export interface PaginatedInterface<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export interface ValidationInterface {
   result: boolean;
   message?: string;
@@ -1,13 +1,15 @@
 import { useEffect, useState } from 'react';
 import api from '../services/api';
 import ListingCard from '../components/listings/ListingCard';
-import type { ListingInterface } from '../interfaces/interfaces';
+import type { ListingInterface, PaginatedInterface } from '../interfaces/interfaces';
 import ListingSkeleton from '../components/listings/ListingSkeleton';
 import { useNavigate, useSearchParams } from 'react-router-dom';
 
 const Home = () => {
   const [listings, setListings] = useState<ListingInterface[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
   const [loading, setLoading] = useState<boolean>(true);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const [error, setError] = useState<string>('');
   const [searchParams] = useSearchParams();
   const searchParam = searchParams.get('search') || '';
@@ -17,10 +19,11 @@ const Home = () => {
     setLoading(true);
     setError('');
     try {
-      const response = await api.get('/listings/', {
+      const response = await api.get<PaginatedInterface<ListingInterface>>('/listings/', {
         params: { search: searchParam },
       });
-      setListings(response.data);
+      setListings(response.data.results);
+      setNextPage(response.data.next);
     } catch (error) {
       setError('Error loading posts');
     } finally {
@@ -28,6 +31,20 @@ const Home = () => {
     }
   };
 
+  const fetchMore = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const response = await api.get<PaginatedInterface<ListingInterface>>(nextPage);
+      setListings((prev) => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (error) {
+      setError('Error loading posts');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchListings();
     document.title = searchParam == '' ? 'Marketplace' : 'Search | Marketplace';
@@ -67,6 +84,19 @@ const Home = () => {
           </div>
         )}
       </div>
+
+      {!loading && nextPage && (
+        <div className='flex justify-center mt-12'>
+          <button
+            type='button'
+            disabled={loadingMore}
+            className='px-6 py-3 bg-blue-600 text-white rounded-xl font-semibold shadow-lg hover:bg-blue-700 transition-all disabled:opacity-50'
+            onClick={fetchMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
     </main>
   );
 };
@@ -1,21 +1,24 @@
 import { useEffect, useState } from 'react';
 import api from '../services/api';
 import { Link } from 'react-router-dom';
-import type { OrderInterface } from '../interfaces/interfaces';
+import type { OrderInterface, PaginatedInterface } from '../interfaces/interfaces';
 import { formatError, parseError } from '../utils/errors';
 import { getStatusStyles } from '../utils/formatters';
 
 const Orders = () => {
   const [orders, setOrders] = useState<OrderInterface[] | null>(null);
+  const [nextPage, setNextPage] = useState<string | null>(null);
   const [loading, setLoading] = useState<boolean>(true);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const [mode, setMode] = useState<'buyer' | 'seller'>('buyer');
   const [errors, setErrors] = useState<Record<string, string[]>>({});
 
   const fetchOrders = async () => {
     setLoading(true);
     try {
-      const response = await api.get(`/order/?view=${mode}`);
-      setOrders(response.data);
+      const response = await api.get<PaginatedInterface<OrderInterface>>(`/order/?view=${mode}`);
+      setOrders(response.data.results);
+      setNextPage(response.data.next);
     } catch (error) {
       const { errors, message } = parseError(error);
       console.error(message);
@@ -25,6 +28,22 @@ const Orders = () => {
     }
   };
 
+  const fetchMore = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const response = await api.get<PaginatedInterface<OrderInterface>>(nextPage);
+      setOrders((prev) => [...(prev ?? []), ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (error) {
+      const { errors, message } = parseError(error);
+      console.error(message);
+      setErrors(errors);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     document.title = 'Orders | Marketplace';
   }, []);
@@ -165,6 +184,19 @@ const Orders = () => {
           </div>
         )}
       </div>
+
+      {nextPage && (
+        <div className='flex justify-center mt-8'>
+          <button
+            type='button'
+            disabled={loadingMore}
+            className='px-6 py-3 bg-indigo-600 text-white rounded-xl font-semibold shadow-lg hover:bg-indigo-700 transition-all disabled:opacity-50'
+            onClick={fetchMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import api from '../services/api';
-import type { ListingInterface, UserInterface } from '../interfaces/interfaces';
+import type { ListingInterface, PaginatedInterface, UserInterface } from '../interfaces/interfaces';
 import ListingCard from '../components/listings/ListingCard';
 import { useAuth } from '../context/AuthContext';
 
@@ -9,7 +9,9 @@ const Profile = () => {
   const { username } = useParams<string>();
   const [profile, setProfile] = useState<UserInterface | null>(null);
   const [listings, setListings] = useState<ListingInterface[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
   const [loading, setLoading] = useState<boolean>(true);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const [error, setError] = useState<string>('');
 
   const { user } = useAuth();
@@ -21,10 +23,13 @@ const Profile = () => {
     try {
       const [profileResponse, listingResponse] = await Promise.all([
         api.get(`/users/${username}/`),
-        api.get(`/listings/?seller__username=${username}&profile=true`),
+        api.get<PaginatedInterface<ListingInterface>>(
+          `/listings/?seller__username=${username}&profile=true&page_size=100`
+        ),
       ]);
       setProfile(profileResponse.data);
-      setListings(listingResponse.data);
+      setListings(listingResponse.data.results);
+      setNextPage(listingResponse.data.next);
     } catch (error: any) {
       if (error.response?.status === 404) {
         setError('User not found.');
@@ -36,6 +41,20 @@ const Profile = () => {
     }
   };
 
+  const fetchMore = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const response = await api.get<PaginatedInterface<ListingInterface>>(nextPage);
+      setListings((prev) => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (error) {
+      setError('Error loading profile.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchProfile();
     document.title = `${username} Profile | Marketplace`;
@@ -98,7 +117,10 @@ const Profile = () => {
               {/* Stats */}
               <div className='flex justify-center md:justify-start gap-8 border-t border-gray-100 pt-4'>
                 <div>
-                  <span className='block font-bold text-gray-900'>{listings.length}</span>
+                  <span className='block font-bold text-gray-900'>
+                    {listings.length}
+                    {nextPage && '+'}
+                  </span>
                   <span className='text-xs text-gray-500 uppercase tracking-wider'>Listings</span>
                 </div>
               </div>
@@ -147,6 +169,19 @@ const Profile = () => {
             )}
           </div>
         )}
+
+        {nextPage && (
+          <div className='flex justify-center mt-12'>
+            <button
+              type='button'
+              disabled={loadingMore}
+              className='px-6 py-3 bg-blue-600 text-white rounded-xl font-semibold shadow-lg hover:bg-blue-700 transition-all disabled:opacity-50'
+              onClick={fetchMore}
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );